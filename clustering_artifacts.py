@@ -0,0 +1,81 @@
+import json
+import os
+import pandas as pd
+from notebooks.custom_functions import CustomerSegmentation
+
+# PARAMETERS
+CLUSTERING_DIR = 'output/clustering'
+MAX_CLUSTERS = 10
+MIN_CLUSTER_PERCENT = 0.002
+
+
+def save_clustering(output_dir: str,
+                    place: str,
+                    model: CustomerSegmentation,
+                    customer_types: pd.DataFrame,
+                    sse: dict,
+                    fingerprint: str = '') -> None:
+    """
+    This function stores the clustering artifacts of a venue.
+    Args:
+        output_dir (str): Directory with the clustering artifacts.
+        place (str): Venue of the artifacts.
+        model (CustomerSegmentation): Fitted segmentation model.
+        customer_types (pd.DataFrame): Customer types of the venue.
+        sse (dict): Sum of squared errors for each number of clusters tested.
+        fingerprint (str): Fingerprint of the customers of the venue, stored to detect stale artifacts.
+    """
+    venue_dir = os.path.join(output_dir, place)
+    os.makedirs(venue_dir, exist_ok=True)
+
+    model.save(os.path.join(venue_dir, 'model.npz'))
+    customer_types.to_csv(os.path.join(venue_dir, 'customer_types.csv'),
+                          index=False)
+    with open(os.path.join(venue_dir, 'selection.json'), 'w') as f:
+        json.dump(
+            {
+                'place': place,
+                'n_clusters': model.n_clusters,
+                'sse': {str(k): v
+                        for k, v in sse.items()},
+                'fingerprint': fingerprint,
+            },
+            f,
+            indent=2)
+
+
+def load_clustering(output_dir: str,
+                    place: str,
+                    fingerprint: str = None) -> dict:
+    """
+    This function loads the clustering artifacts of a venue.
+    Args:
+        output_dir (str): Directory with the clustering artifacts.
+        place (str): Venue of the artifacts.
+        fingerprint (str): Fingerprint of the current customers of the venue. If given, artifacts
+            computed from other customers are considered stale.
+    Returns:
+        clustering (dict): Model, customer types, number of clusters, SSE and fingerprint of the venue,
+            or None if the pipeline has not been run for the venue or its artifacts are stale.
+    """
+    venue_dir = os.path.join(output_dir, place)
+    if not os.path.exists(os.path.join(venue_dir, 'selection.json')):
+        return None
+
+    with open(os.path.join(venue_dir, 'selection.json')) as f:
+        selection = json.load(f)
+    if fingerprint is not None and selection.get('fingerprint') != fingerprint:
+        return None
+
+    return {
+        'model':
+        CustomerSegmentation.load(os.path.join(venue_dir, 'model.npz')),
+        'customer_types':
+        pd.read_csv(os.path.join(venue_dir, 'customer_types.csv')),
+        'n_clusters':
+        selection['n_clusters'],
+        'sse': {int(k): v
+                for k, v in selection['sse'].items()},
+        'fingerprint':
+        selection.get('fingerprint', ''),
+    }
@@ -0,0 +1,210 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# PARAMETERS
+COHORTS_DIR = 'output/cohorts'
+RETENTION_FILE = 'retention.csv'
+GAPS_FILE = 'gaps.csv'
+METADATA_FILE = 'cohorts.json'
+WEIGHT_COLUMN = 'customer_weight'
+# Lower edges, in days, of the bins of the time between two visits of the same device
+GAP_BINS_DAYS = [0, 1, 2, 3, 7, 14, 30, 60, 90, 180]
+
+#! Subfunctions
+
+
+def gap_labels() -> list:
+    """
+    This function returns the labels of the bins of the time between visits.
+    Returns:
+        labels (list): Label of each bin, in days.
+    """
+    return [
+        f'{low}-{high}' for low, high in zip(GAP_BINS_DAYS, GAP_BINS_DAYS[1:])
+    ] + [f'{GAP_BINS_DAYS[-1]}+']
+
+
+def _device_visits(data: pd.DataFrame, weight_column: str) -> dict:
+    """
+    This function sorts the visits by place, device and start time, using integer codes for the places and devices,
+    so that the visits of each device at each place are contiguous and in chronological order.
+    Args:
+        data (pd.DataFrame): Dataframe with the data.
+        weight_column (str): Column with the weight of the devices.
+    Returns:
+        visits (dict): Sorted arrays of the visits, with the flag of the first visit and the code of each device.
+    """
+    place_codes, places = pd.factorize(data['place'], sort=True)
+    device_codes, _ = pd.factorize(data['device_id'])
+    times = pd.to_datetime(data['visit_start_time']).to_numpy(
+        dtype='datetime64[ns]')
+
+    order = np.lexsort((times.view(np.int64), device_codes, place_codes))
+    place_codes, device_codes = place_codes[order], device_codes[order]
+
+    # A new device starts where the place or the device changes in the sorted visits
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (place_codes[1:] != place_codes[:-1]) | (device_codes[1:] !=
+                                                         device_codes[:-1])
+    return {
+        'places': places,
+        'place_codes': place_codes,
+        'devices': np.cumsum(first) - 1,
+        'first': first,
+        'times': times[order],
+        'weights': data[weight_column].to_numpy(dtype=np.float64)[order],
+    }
+
+
+#! Cohort analysis
+
+
+def cohort_retention(data: pd.DataFrame,
+                     weight_column: str = WEIGHT_COLUMN) -> pd.DataFrame:
+    """
+    This function groups the devices of each venue by the month of their first visit (cohort), and computes the
+    share of each cohort, weighted by customer weight, that visits the venue again in every subsequent month.
+    The customer weight is constant for the visits of a device to a venue, so the weight of its first visit is used.
+    Args:
+        data (pd.DataFrame): Dataframe with the data.
+        weight_column (str): Column with the weight of the devices.
+    Returns:
+        retention (pd.DataFrame): Dataframe with the devices, weight and retention of every cohort and month
+        since the first visit, until the last month of the data.
+    """
+    visits = _device_visits(data, weight_column)
+    first, devices = visits['first'], visits['devices']
+    months = visits['times'].astype('datetime64[M]').astype(np.int64)
+
+    # Months since the first visit of the device, with one entry per device and month with visits
+    first_months = months[first]
+    months_since_first = months - first_months[devices]
+    active = first.copy()
+    active[1:] |= months_since_first[1:] != months_since_first[:-1]
+    active_devices = devices[active]
+
+    # Counting devices and summing their weights per place, cohort and month since the first visit
+    first_month = months.min() if len(months) else 0
+    n_months = int(months.max() - first_month + 1) if len(months) else 0
+    n_places = len(visits['places'])
+    cohorts = first_months - first_month
+    keys = (visits['place_codes'][first][active_devices] * n_months +
+            cohorts[active_devices]) * n_months + months_since_first[active]
+    shape = (n_places, n_months, n_months)
+    n_devices = np.bincount(keys, minlength=np.prod(shape)).reshape(shape)
+    weight = np.bincount(keys,
+                         weights=visits['weights'][first][active_devices],
+                         minlength=np.prod(shape)).reshape(shape)
+
+    # Keeping the months of each cohort observed in the data
+    place, cohort, month = np.indices(shape)
+    observed = (n_devices[:, :, :1] > 0) & (cohort + month < n_months)
+    cohort_devices = np.broadcast_to(n_devices[:, :, :1], shape)[observed]
+    cohort_weight = np.broadcast_to(weight[:, :, :1], shape)[observed]
+
+    retention = pd.DataFrame({
+        'place':
+        np.asarray(visits['places'])[place[observed]],
+        'cohort':
+        (first_month + cohort[observed]).astype('datetime64[M]').astype(str),
+        'months_since_first':
+        month[observed],
+        'devices':
+        n_devices[observed],
+        'cohort_devices':
+        cohort_devices,
+        'weight':
+        weight[observed],
+        'cohort_weight':
+        cohort_weight,
+    })
+    with np.errstate(invalid='ignore', divide='ignore'):
+        retention['retention'] = retention['weight'] / retention[
+            'cohort_weight']
+    retention['device_retention'] = retention['devices'] / retention[
+        'cohort_devices']
+    return retention
+
+
+def inter_visit_gaps(data: pd.DataFrame,
+                     weight_column: str = WEIGHT_COLUMN) -> pd.DataFrame:
+    """
+    This function computes the distribution of the time between two consecutive visits of the same device to each venue,
+    weighted by customer weight.
+    Args:
+        data (pd.DataFrame): Dataframe with the data.
+        weight_column (str): Column with the weight of the devices.
+    Returns:
+        gaps (pd.DataFrame): Dataframe with the visits, weight and percentage of weight of every bin of days per venue.
+    """
+    visits = _device_visits(data, weight_column)
+
+    # Time since the previous visit of the same device, leaving out the first visit of each device
+    repeated = ~visits['first'][1:]
+    gap_days = np.diff(visits['times']).astype('timedelta64[s]').astype(
+        np.float64)[repeated] / 86400
+    bins = np.searchsorted(GAP_BINS_DAYS, gap_days, side='right') - 1
+
+    n_places, n_bins = len(visits['places']), len(GAP_BINS_DAYS)
+    keys = visits['place_codes'][1:][repeated] * n_bins + bins
+    shape = (n_places, n_bins)
+    n_visits = np.bincount(keys, minlength=np.prod(shape)).reshape(shape)
+    weight = np.bincount(keys,
+                         weights=visits['weights'][1:][repeated],
+                         minlength=np.prod(shape)).reshape(shape)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        pct = 100 * weight / weight.sum(axis=1, keepdims=True)
+
+    return pd.DataFrame({
+        'place': np.repeat(np.asarray(visits['places']), n_bins),
+        'gap_days': np.tile(gap_labels(), n_places),
+        'visits': n_visits.ravel(),
+        'weight': weight.ravel(),
+        'pct': pct.ravel(),
+    })
+
+
+#! Pipeline outputs
+
+
+def write_cohorts(data: pd.DataFrame,
+                  directory: str = COHORTS_DIR,
+                  fingerprint: str = '') -> tuple:
+    """
+    This function computes the cohort retention and the time between visits of every venue and stores them.
+    Args:
+        data (pd.DataFrame): Dataframe with the data.
+        directory (str): Directory of the cohort outputs.
+        fingerprint (str): Fingerprint of the data, stored to detect stale outputs.
+    Returns:
+        retention (pd.DataFrame): Cohort retention of every venue.
+        gaps (pd.DataFrame): Distribution of the time between visits of every venue.
+    """
+    os.makedirs(directory, exist_ok=True)
+    retention, gaps = cohort_retention(data), inter_visit_gaps(data)
+    retention.to_csv(os.path.join(directory, RETENTION_FILE), index=False)
+    gaps.to_csv(os.path.join(directory, GAPS_FILE), index=False)
+    with open(os.path.join(directory, METADATA_FILE), 'w') as f:
+        json.dump({'fingerprint': fingerprint}, f, indent=2)
+    return retention, gaps
+
+
+def load_cohorts(directory: str = COHORTS_DIR, fingerprint: str = '') -> tuple:
+    """
+    This function loads the cohort outputs of the pipeline, if they were computed from the same data.
+    Args:
+        directory (str): Directory of the cohort outputs.
+        fingerprint (str): Fingerprint of the data.
+    Returns:
+        cohorts (tuple): Cohort retention and time between visits, or None if they are missing or stale.
+    """
+    metadata_file = os.path.join(directory, METADATA_FILE)
+    if not os.path.exists(metadata_file):
+        return None
+    with open(metadata_file) as f:
+        if json.load(f)['fingerprint'] != fingerprint:
+            return None
+    return (pd.read_csv(os.path.join(directory, RETENTION_FILE)),
+            pd.read_csv(os.path.join(directory, GAPS_FILE)))
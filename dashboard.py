@@ -1,5 +1,4 @@
 import streamlit as st
-import pandas as pd
 from utils import (
     analysis_date_level,
     analysis_hour_level,
@@ -8,9 +7,13 @@ from utils import (
     analysis_month_level,
     analysis_distance_from_home_level,
     analysis_distance_from_work_level,
+    analysis_cohort_level,
     map_venues,
     cluster_analysis,
     conclusions_pf,
+    load_shared_data,
+    select_date_window,
+    show_warm_up_progress,
 )
 
 APP_TITLE = 'Planet Fitness Customer Analysis'
@@ -25,9 +28,9 @@ def main():
     st.set_option('deprecation.showPyplotGlobalUse', False)
 
     #! Load data
-    # Reading the two datasets for plotting
-    data = pd.read_csv('output/data.csv')
-    customers = pd.read_csv('output/customers.csv')
+    # Reading the two datasets for plotting, once per server process and shared by all the sessions
+    shared = load_shared_data('output/data.csv', 'output/customers.csv')
+    customers = shared.customers
 
     # Selecting which analysis to show using buttons
     analysis = st.sidebar.radio(
@@ -40,12 +43,17 @@ def main():
             'Month',
             'Distance from Home',
             'Distance from Work',
+            'Cohort retention',
             'Geo-location all venues',
             'Clustering analysis',
             'Conclusions',
         ],
     )
 
+    # Narrowing the visits of all the analyses to the selected date range
+    show_warm_up_progress(shared)
+    data = select_date_window(shared)
+
     if analysis == 'Date':
         column = 'start_date'
         analysis_date_level(data, column)
@@ -67,6 +75,9 @@ def main():
     elif analysis == 'Distance from Work':
         column = 'distance_from_work_miles'
         analysis_distance_from_work_level(data, column)
+    elif analysis == 'Cohort retention':
+        column = 'visit_start_time'
+        analysis_cohort_level(data, column)
     elif analysis == 'Geo-location all venues':
         map_venues(data, customers)
     elif analysis == 'Clustering analysis':
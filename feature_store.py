@@ -0,0 +1,133 @@
+import json
+import os
+from typing import List
+import numpy as np
+import pandas as pd
+
+# PARAMETERS
+FEATURES_DIR = 'output/features'
+# Numeric features per customer, stored as a row-major matrix
+FEATURE_COLUMNS = [
+    'distance_from_home_miles_mean',
+    'distance_from_work_miles_mean',
+    'time_in_place_minutes',
+    'visit_hour',
+    'visit_count',
+    'pct_weekend',
+    'places_visits',
+]
+# The customer weight, used as sample weight, is stored apart so that the features of a venue are a contiguous block
+WEIGHT_COLUMN = 'customer_weight'
+MATRIX_FILE = 'features.npy'
+WEIGHTS_FILE = 'weights.npy'
+METADATA_FILE = 'features.json'
+
+
+def write_feature_store(customers: pd.DataFrame,
+                        directory: str = FEATURES_DIR,
+                        fingerprint: str = '') -> 'FeatureStore':
+    """
+    This function writes the numeric features of the customers as a row-major float32 matrix, and their weights
+    as a float32 vector, with the customers of each venue in a contiguous range of rows.
+    Args:
+        customers (pd.DataFrame): Dataframe with the customers data.
+        directory (str): Directory of the feature store.
+        fingerprint (str): Fingerprint of the customers data, stored to detect stale feature stores.
+    Returns:
+        store (FeatureStore): The feature store, memory-mapped read-only.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    # Sorting the customers by place, keeping their order within each place
+    codes, places = pd.factorize(customers['place'], sort=True)
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(places) + 1))
+
+    # Writing to temporary files first, so that readers never see a partial feature store
+    for file_name, columns in [(MATRIX_FILE, FEATURE_COLUMNS),
+                               (WEIGHTS_FILE, WEIGHT_COLUMN)]:
+        values = customers[columns].to_numpy(dtype=np.float32)[order]
+        path = os.path.join(directory, file_name)
+        array = np.lib.format.open_memmap(f'{path}.tmp',
+                                          mode='w+',
+                                          dtype=np.float32,
+                                          shape=values.shape)
+        array[:] = values
+        array.flush()
+        del array
+        os.replace(f'{path}.tmp', path)
+
+    metadata_file = os.path.join(directory, METADATA_FILE)
+    with open(f'{metadata_file}.tmp', 'w') as f:
+        json.dump(
+            {
+                'columns': FEATURE_COLUMNS,
+                'weight': WEIGHT_COLUMN,
+                'fingerprint': fingerprint,
+                'places': {
+                    place: [int(bounds[i]), int(bounds[i + 1])]
+                    for i, place in enumerate(places)
+                },
+            },
+            f,
+            indent=2)
+    os.replace(f'{metadata_file}.tmp', metadata_file)
+
+    return FeatureStore(directory)
+
+
+class FeatureStore:
+    """
+    Read-only memory-mapped matrix of customers features and vector of customer weights, written by the batch pipeline.
+    They are mapped from disk, so threads and processes reading them share the same pages, and the features of
+    a venue are a contiguous row-major view of its rows, without copying them.
+    Args:
+        directory (str): Directory of the feature store.
+    """
+
+    def __init__(self, directory: str = FEATURES_DIR):
+        with open(os.path.join(directory, METADATA_FILE)) as f:
+            metadata = json.load(f)
+        self.columns = metadata['columns']
+        self.weight_column = metadata['weight']
+        self.fingerprint = metadata['fingerprint']
+        self.offsets = {
+            place: tuple(rows)
+            for place, rows in metadata['places'].items()
+        }
+        self.matrix = np.load(os.path.join(directory, MATRIX_FILE),
+                              mmap_mode='r')
+        self.weights = np.load(os.path.join(directory, WEIGHTS_FILE),
+                               mmap_mode='r')
+
+    @classmethod
+    def open(cls, directory: str = FEATURES_DIR) -> 'FeatureStore':
+        """
+        This function opens a feature store, if the pipeline has written it.
+        Args:
+            directory (str): Directory of the feature store.
+        Returns:
+            store (FeatureStore): The feature store, or None if it does not exist.
+        """
+        if not os.path.exists(os.path.join(directory, METADATA_FILE)):
+            return None
+        return cls(directory)
+
+    @property
+    def feature_names(self) -> List[str]:
+        """
+        This function returns the names of the features.
+        """
+        return self.columns
+
+    def features(self, place: str) -> tuple:
+        """
+        This function returns the features and the weights of the customers of a venue, as views of the stored arrays.
+        Args:
+            place (str): Venue of the customers.
+        Returns:
+            features (np.ndarray): The contiguous (n_customers, n_features) view of the features.
+            weights (np.ndarray): The view of the customer weights.
+        """
+        first, last = self.offsets[place]
+        return self.matrix[first:last], self.weights[first:last]
@@ -0,0 +1,190 @@
+import hashlib
+import json
+import os
+import threading
+import weakref
+from typing import Callable, List
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+
+# PARAMETERS
+FIGURE_CACHE_DIR = 'output/figures'
+FIGURE_CACHE_MAX_BYTES = 512 * 1024**2
+
+# Fingerprints of the dataframes alive, by id. Not stored in the attrs of the dataframes,
+# since pandas propagates attrs to the dataframes derived from them (e.g. filtered or sliced)
+_fingerprints = {}
+
+
+def data_fingerprint(*frames: pd.DataFrame) -> str:
+    """
+    This function computes a fingerprint of the content of one or more dataframes.
+    The fingerprint of each dataframe is memoized while the dataframe is alive, so it is only computed once per loaded dataframe.
+    Args:
+        frames (pd.DataFrame): Dataframes to be fingerprinted.
+    Returns:
+        fingerprint (str): Hexadecimal fingerprint.
+    """
+    digest = hashlib.sha1()
+    for frame in frames:
+        memo = _fingerprints.get(id(frame))
+        if memo is None or memo[0]() is not frame:
+            frame_digest = hashlib.sha1(
+                pd.util.hash_pandas_object(frame, index=False).values)
+            frame_digest.update(','.join(map(str, frame.columns)).encode())
+            key = id(frame)
+            memo = (weakref.ref(frame,
+                                lambda _, key=key: _fingerprints.pop(key, None)),
+                    frame_digest.hexdigest())
+            _fingerprints[key] = memo
+        digest.update(memo[1].encode())
+    return digest.hexdigest()
+
+
+class FigureCache:
+    """
+    Size-bounded on-disk cache of rendered figures (plotly JSON) and maps (folium HTML).
+    Entries are keyed by analysis, selected venues and data fingerprint, and the least
+    recently used entries are evicted when the cache grows over its maximum size.
+    Args:
+        directory (str): Directory of the cache.
+        max_bytes (int): Maximum size of the cache in bytes.
+    """
+
+    def __init__(self,
+                 directory: str = FIGURE_CACHE_DIR,
+                 max_bytes: int = FIGURE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(analysis: str, selected_venues: List[str],
+            fingerprint: str) -> str:
+        """
+        This function computes the key of a cache entry.
+        Args:
+            analysis (str): Name of the analysis.
+            selected_venues (List[str]): Selected venues, in any order.
+            fingerprint (str): Fingerprint of the data of the analysis.
+        Returns:
+            key (str): Key of the entry.
+        """
+        content = json.dumps([analysis, sorted(selected_venues), fingerprint])
+        return hashlib.sha1(content.encode()).hexdigest()
+
+    def _path(self, key: str, extension: str) -> str:
+        """
+        This function returns the file of an entry of the cache.
+        Args:
+            key (str): Key of the entry.
+            extension (str): Extension of the entry file, '.json' or '.html'.
+        Returns:
+            path (str): Path of the entry file.
+        """
+        return os.path.join(self.directory, key + extension)
+
+    def get(self, key: str, extension: str) -> str:
+        """
+        This function reads an entry of the cache, marking it as recently used.
+        Args:
+            key (str): Key of the entry.
+            extension (str): Extension of the entry file, '.json' or '.html'.
+        Returns:
+            content (str): Content of the entry, or None if it is not cached.
+        """
+        path = self._path(key, extension)
+        try:
+            with open(path, encoding='utf-8') as f:
+                content = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return content
+
+    def put(self, key: str, extension: str, content: str) -> None:
+        """
+        This function writes an entry of the cache, evicting the least recently used entries if needed.
+        Args:
+            key (str): Key of the entry.
+            extension (str): Extension of the entry file, '.json' or '.html'.
+            content (str): Content of the entry.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key, extension)
+
+        # Writing to a temporary file first, so that readers never see partial entries
+        temporary_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(temporary_path, path)
+
+        self._evict()
+
+    def _evict(self) -> None:
+        """
+        This function removes the least recently used entries until the cache fits its maximum size.
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(('.json', '.html')):
+                # Another session may evict the entry at the same time
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+
+    def figures(self, analysis: str, selected_venues: List[str],
+                fingerprint: str,
+                build: Callable[[], List[go.Figure]]) -> List[go.Figure]:
+        """
+        This function returns the cached figures of an analysis, building and caching them if needed.
+        Args:
+            analysis (str): Name of the analysis.
+            selected_venues (List[str]): Selected venues.
+            fingerprint (str): Fingerprint of the data of the analysis.
+            build (Callable): Function building the figures.
+        Returns:
+            figures (List[go.Figure]): Figures of the analysis.
+        """
+        key = self.key(analysis, selected_venues, fingerprint)
+        cached = self.get(key, '.json')
+        if cached is not None:
+            return [pio.from_json(figure) for figure in json.loads(cached)]
+
+        figures = build()
+        self.put(key, '.json',
+                 json.dumps([figure.to_json() for figure in figures]))
+        return figures
+
+    def html(self, analysis: str, selected_venues: List[str],
+             fingerprint: str, build: Callable[[], str]) -> str:
+        """
+        This function returns the cached HTML of an analysis (e.g. a map), building and caching it if needed.
+        Args:
+            analysis (str): Name of the analysis.
+            selected_venues (List[str]): Selected venues.
+            fingerprint (str): Fingerprint of the data of the analysis.
+            build (Callable): Function building the HTML.
+        Returns:
+            html (str): HTML of the analysis.
+        """
+        key = self.key(analysis, selected_venues, fingerprint)
+        cached = self.get(key, '.html')
+        if cached is not None:
+            return cached
+
+        html = build()
+        self.put(key, '.html', html)
+        return html
@@ -1,3 +1,5 @@
+import os
+import re
 import pandas as pd
 import numpy as np
 from sklearn.cluster import KMeans
@@ -12,10 +14,47 @@ def read_file(file_name: str) -> pd.DataFrame:
         data (pd.DataFrame): The pandas dataframe.
     """
     data = pd.read_csv(file_name)
-    data['place'] = file_name.split('_')[4:].pop(0).lower()
+    data['place'] = venue_key(file_address(file_name))
     return data
 
 
+def file_address(file_name: str) -> str:
+    """
+    This function returns the address of the venue of a visits file, from its name.
+    Args:
+        file_name (str): The name of the file, e.g. 'data/visits_Planet_Fitness_299_Molly_Lane_Woodstock_GA_..._2019-02-01.csv'.
+    Returns:
+        venue_address (str): The address of the venue, e.g. '299 Molly Lane Woodstock GA ...'.
+    """
+    # visits_Planet_Fitness_<address>_<start date>_<end date>.csv
+    return ' '.join(os.path.basename(file_name).split('_')[3:-2])
+
+
+def venue_key(venue_address: str) -> str:
+    """
+    This function returns the place of a venue: a slug of its full address. It is used both for the visits files
+    (see read_file) and for the venues metadata, so that both are keyed by the same place, and it only
+    matches the venues with the same address, whatever the separators of the address.
+    Args:
+        venue_address (str): The address of the venue, e.g. '299 Molly Lane, Woodstock, GA, United States'.
+    Returns:
+        place (str): The place of the venue, e.g. '299-molly-lane-woodstock-ga-united-states'.
+    """
+    return re.sub(r'[^a-z0-9]+', '-', venue_address.lower()).strip('-')
+
+
+def venue_name(venue_address: str) -> str:
+    """
+    This function returns the short name of a venue from its address, used to label it.
+    Several venues may have the same name, so it is not used as the key of the venues.
+    Args:
+        venue_address (str): The address of the venue, e.g. '299 Molly Lane, Woodstock, GA, United States'.
+    Returns:
+        name (str): The name of the venue, e.g. 'molly'.
+    """
+    return venue_address.split()[1].strip(',').lower()
+
+
 def haversine_distance(lat1: float, lon1: float, lat2: float,
                        lon2: float) -> float:
     """
@@ -62,56 +101,489 @@ def remove_outliers(df: pd.DataFrame, col: str, q1: float,
     return df
 
 
-def optimal_clusters_sse(data: pd.DataFrame, max_k: int,
-                         min_percent: float) -> dict:
+def _split_weights(data: pd.DataFrame, weight_column: str) -> tuple:
     """
-    This function finds the optimal number of clusters for a dataset based on a minimum percentage per cluster.
+    This function splits the sample weights from the features of a dataset.
     Args:
         data (pd.DataFrame): The dataset to be used.
+        weight_column (str): The column holding the sample weights.
+    Returns:
+        features (pd.DataFrame): The dataset without the weight column.
+        weights (np.ndarray): The sample weights, or None if the column is missing.
+    """
+    if weight_column not in data.columns:
+        return data, None
+    return data.drop(columns=[weight_column]), data[weight_column].to_numpy()
+
+
+def _closest_centroid(data: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """
+    This function assigns each row of a matrix to its closest centroid.
+    Args:
+        data (np.ndarray): The (n_samples, n_features) matrix to be assigned.
+        centroids (np.ndarray): The (n_clusters, n_features) centroids.
+    Returns:
+        labels (np.ndarray): The index of the closest centroid for each row.
+    """
+    # ||x - c||^2 = ||x||^2 - 2 x.c + ||c||^2, and ||x||^2 does not change the argmin
+    distances = (centroids**2).sum(axis=1) - 2 * data @ centroids.T
+    return distances.argmin(axis=1)
+
+
+class CustomerSegmentation:
+    """
+    K-means segmentation of customers on standardized features, weighted by the customer weight.
+    The features are standardized once, when the model is fitted, so that predictions and
+    partial updates with new data share the same feature space as the persisted centroids.
+    Args:
+        n_clusters (int): The number of clusters to be used.
+        random_state (int): The seed used to initialize the centroids.
+    """
+
+    def __init__(self, n_clusters: int, random_state: int = 42):
+        self.n_clusters = n_clusters
+        self.random_state = random_state
+        self.feature_names = None
+        self.mean_ = None
+        self.scale_ = None
+        self.cluster_centers_ = None  # In standardized units
+        self.counts_ = None  # Accumulated sample weight per cluster
+        self.labels_ = None
+        self.inertia_ = None
+
+    def _as_array(self, data) -> np.ndarray:
+        """
+        This function converts the input data to a float matrix with the model features.
+        Float32 matrices (e.g. views of the feature store) are used as they are, without copying them.
+        Args:
+            data (pd.DataFrame or np.ndarray): The data to be converted.
+        Returns:
+            data (np.ndarray): The float matrix.
+        """
+        if isinstance(data, pd.DataFrame):
+            if self.feature_names is None:
+                self.feature_names = list(data.columns)
+            data = data[self.feature_names].to_numpy()
+        data = np.asarray(data)
+        if data.dtype != np.float32:
+            data = data.astype(np.float64, copy=False)
+        return data
+
+    def _sample_weights(self, data: np.ndarray, sample_weight) -> np.ndarray:
+        """
+        This function validates the sample weights, falling back to uniform weights when
+        there are not enough weighted samples to seed every cluster.
+        Args:
+            data (np.ndarray): The float matrix.
+            sample_weight (np.ndarray): The sample weights, or None.
+        Returns:
+            weights (np.ndarray): The sample weights.
+        """
+        if sample_weight is None:
+            return np.ones(len(data))
+        weights = np.asarray(sample_weight, dtype=np.float64)
+        if (weights > 0).sum() < self.n_clusters:
+            return np.ones(len(data))
+        return weights
+
+    def _standardize(self, data: np.ndarray) -> np.ndarray:
+        """
+        This function standardizes the data with the mean and scale of the original fit.
+        Args:
+            data (np.ndarray): The float matrix.
+        Returns:
+            data (np.ndarray): The standardized matrix.
+        """
+        return (data - self.mean_.astype(data.dtype)) / self.scale_.astype(
+            data.dtype)
+
+    def fit(self,
+            data,
+            sample_weight=None,
+            feature_names: list = None) -> 'CustomerSegmentation':
+        """
+        This function standardizes the features and fits the centroids from scratch.
+        Args:
+            data (pd.DataFrame or np.ndarray): The customers features.
+            sample_weight (np.ndarray): The weight of each customer.
+            feature_names (list): The names of the features, when data is a matrix.
+        Returns:
+            self (CustomerSegmentation): The fitted model.
+        """
+        self.feature_names = feature_names
+        data = self._as_array(data)
+        self._set_scaling(data)
+        return self._fit_standardized(self._standardize(data), sample_weight)
+
+    def _set_scaling(self, data: np.ndarray) -> None:
+        """
+        This function computes the mean and scale used to standardize the features.
+        Args:
+            data (np.ndarray): The float matrix.
+        """
+        self.mean_ = data.mean(axis=0, dtype=np.float64)
+        scale = data.std(axis=0, dtype=np.float64)
+        self.scale_ = np.where(scale > 0, scale, 1.0)
+
+    def _fit_standardized(self, standardized: np.ndarray,
+                          sample_weight=None) -> 'CustomerSegmentation':
+        """
+        This function fits the centroids from scratch on features already standardized with the model scaling.
+        Args:
+            standardized (np.ndarray): The standardized matrix. KMeans centers it in place and restores it afterwards.
+            sample_weight (np.ndarray): The weight of each customer.
+        Returns:
+            self (CustomerSegmentation): The fitted model.
+        """
+        weights = self._sample_weights(standardized, sample_weight)
+
+        # The standardized matrix is a working copy owned by the caller, so KMeans does not need to copy it again
+        kmeans = KMeans(n_clusters=self.n_clusters,
+                        init='k-means++',
+                        n_init=10,
+                        max_iter=1000,
+                        copy_x=False,
+                        random_state=self.random_state)
+        kmeans.fit(standardized, sample_weight=weights)
+
+        self.cluster_centers_ = kmeans.cluster_centers_
+        self.labels_ = kmeans.labels_
+        self.counts_ = np.bincount(kmeans.labels_,
+                                   weights=weights,
+                                   minlength=self.n_clusters)
+        self.inertia_ = kmeans.inertia_  # Inertia: Sum of distances of samples to their closest cluster center
+        return self
+
+    def predict(self, data, batch_size: int = 65536) -> np.ndarray:
+        """
+        This function assigns customers to the closest persisted centroid.
+        Args:
+            data (pd.DataFrame or np.ndarray): The customers features.
+            batch_size (int): The number of customers assigned at once.
+        Returns:
+            labels (np.ndarray): The cluster of each customer.
+        """
+        data = self._as_array(data)
+        labels = np.empty(len(data), dtype=np.int64)
+        for start in range(0, len(data), batch_size):
+            batch = self._standardize(data[start:start + batch_size])
+            labels[start:start + batch_size] = _closest_centroid(
+                batch, self.cluster_centers_)
+        return labels
+
+    def partial_fit(self,
+                    data,
+                    sample_weight=None,
+                    batch_size: int = 1024) -> 'CustomerSegmentation':
+        """
+        This function moves the centroids towards new customers with mini-batch updates,
+        keeping the standardization of the original fit.
+        Args:
+            data (pd.DataFrame or np.ndarray): The new customers features.
+            sample_weight (np.ndarray): The weight of each new customer.
+            batch_size (int): The number of customers per mini-batch.
+        Returns:
+            self (CustomerSegmentation): The updated model.
+        """
+        if self.cluster_centers_ is None:
+            return self.fit(data, sample_weight)
+
+        data = self._as_array(data)
+        weights = (np.ones(len(data)) if sample_weight is None else
+                   np.asarray(sample_weight, dtype=np.float64))
+
+        for start in range(0, len(data), batch_size):
+            batch = self._standardize(data[start:start + batch_size])
+            batch_weights = weights[start:start + batch_size]
+            labels = _closest_centroid(batch, self.cluster_centers_)
+
+            batch_counts = np.bincount(labels,
+                                       weights=batch_weights,
+                                       minlength=self.n_clusters)
+            batch_sums = np.column_stack([
+                np.bincount(labels,
+                            weights=feature * batch_weights,
+                            minlength=self.n_clusters) for feature in batch.T
+            ])
+
+            # Each centroid is the running weighted mean of the customers assigned to it
+            counts = self.counts_ + batch_counts
+            moved = batch_counts > 0
+            self.cluster_centers_[moved] = (
+                self.cluster_centers_[moved] * self.counts_[moved, None] +
+                batch_sums[moved]) / counts[moved, None]
+            self.counts_ = counts
+
+        self.labels_ = None
+        self.inertia_ = None
+        return self
+
+    def centroids(self) -> pd.DataFrame:
+        """
+        This function returns the centroids in the original units of the features.
+        Returns:
+            centroids (pd.DataFrame): One row per cluster.
+        """
+        return pd.DataFrame(self.cluster_centers_ * self.scale_ + self.mean_,
+                            columns=self.feature_names)
+
+    def save(self, file_name: str) -> None:
+        """
+        This function persists the standardization and the centroids of the model.
+        Args:
+            file_name (str): The name of the .npz file to be written.
+        """
+        np.savez(file_name,
+                 n_clusters=self.n_clusters,
+                 random_state=self.random_state,
+                 feature_names=np.array(self.feature_names or [], dtype=str),
+                 mean=self.mean_,
+                 scale=self.scale_,
+                 cluster_centers=self.cluster_centers_,
+                 counts=self.counts_)
+
+    @classmethod
+    def load(cls, file_name: str) -> 'CustomerSegmentation':
+        """
+        This function loads a model persisted with save.
+        Args:
+            file_name (str): The name of the .npz file to be read.
+        Returns:
+            model (CustomerSegmentation): The loaded model.
+        """
+        with np.load(file_name) as stored:
+            model = cls(int(stored['n_clusters']), int(stored['random_state']))
+            model.feature_names = list(stored['feature_names']) or None
+            model.mean_ = stored['mean']
+            model.scale_ = stored['scale']
+            model.cluster_centers_ = stored['cluster_centers']
+            model.counts_ = stored['counts']
+        return model
+
+
+def _clusters_models(features,
+                     weights: np.ndarray,
+                     max_k: int,
+                     min_percent: float,
+                     feature_names: list = None) -> tuple:
+    """
+    This function fits a model for each number of clusters, stopping when a cluster gets too small.
+    The features are standardized once and every model is fitted on the same standardized matrix.
+    No more clusters than distinct customers are tested, so that small venues can be segmented too.
+    Args:
+        features (pd.DataFrame or np.ndarray): The customers features.
+        weights (np.ndarray): The weight of each customer, or None.
         max_k (int): The maximum number of clusters to be tested.
         min_percent (float): The minimum percentage of data points that a cluster must contain.
+        feature_names (list): The names of the features, when features is a matrix.
     Returns:
+        models (dict): The fitted model for each number of clusters.
         sse (dict): The sum of squared errors for each number of clusters.
     """
-    sse = {}
+    scaling = CustomerSegmentation(n_clusters=1)
+    scaling.feature_names = feature_names
+    data = scaling._as_array(features)
+    scaling._set_scaling(data)
+    standardized = scaling._standardize(data)
+    max_k = min(max_k, len(np.unique(standardized, axis=0)))
+
+    models, sse = {}, {}
     for k in range(1, max_k + 1):
-        kmeans = KMeans(n_clusters=k, max_iter=1000).fit(data)
-        data["clusters"] = kmeans.labels_
-        cluster_counts = data["clusters"].value_counts(normalize=True)
+        model = CustomerSegmentation(n_clusters=k)
+        model.feature_names = scaling.feature_names
+        model.mean_, model.scale_ = scaling.mean_, scaling.scale_
+        model._fit_standardized(standardized, weights)
+        cluster_counts = np.bincount(model.labels_, minlength=k) / len(
+            model.labels_)
         if any(cluster_counts < min_percent):
             break
-        sse[k] = kmeans.inertia_  # Inertia: Sum of distances of samples to their closest cluster center
-    return sse
+        models[k], sse[k] = model, model.inertia_
+    return models, sse
 
 
-def get_customer_types(data: pd.DataFrame, n_clusters: int) -> pd.DataFrame:
+def optimal_clusters_sse(data: pd.DataFrame,
+                         max_k: int,
+                         min_percent: float,
+                         weight_column: str = 'customer_weight') -> dict:
     """
-    This function returns the customer types for a dataset.
+    This function finds the optimal number of clusters for a dataset based on a minimum percentage per cluster.
     Args:
-        data (pd.DataFrame): The dataset to be used.
-        n_clusters (int): The number of clusters to be used.
+        data (pd.DataFrame): The dataset to be used. It is not modified.
+        max_k (int): The maximum number of clusters to be tested.
+        min_percent (float): The minimum percentage of data points that a cluster must contain.
+        weight_column (str): The column used as sample weight instead of as a feature.
+    Returns:
+        sse (dict): The sum of squared errors for each number of clusters.
+    """
+    features, weights = _split_weights(data, weight_column)
+    return _clusters_models(features, weights, max_k, min_percent)[1]
+
+
+def optimal_number_clusters(sse: dict) -> int:
+    """
+    This function selects the number of clusters at the elbow of the SSE curve, that is, the point
+    farthest below the straight line joining the first and the last points of the normalized curve.
+    Args:
+        sse (dict): The sum of squared errors for each number of clusters, as returned by optimal_clusters_sse.
+    Returns:
+        n_clusters (int): The selected number of clusters.
+    """
+    ks = np.array(sorted(sse), dtype=np.float64)
+    if len(ks) < 3:
+        return int(ks[-1]) if len(ks) else 1
+    errors = np.array([sse[k] for k in sorted(sse)], dtype=np.float64)
+
+    x = (ks - ks[0]) / (ks[-1] - ks[0])
+    y = (errors - errors.min()) / max(errors.max() - errors.min(), 1e-12)
+    line = y[0] + (y[-1] - y[0]) * x
+
+    return int(ks[np.argmax(line - y)])
+
+
+def get_customers_behavior(customers: pd.DataFrame,
+                           place: str) -> pd.DataFrame:
+    """
+    This function returns the behavioral features of the customers of a venue, used for clustering.
+    Args:
+        customers (pd.DataFrame): The customers dataset.
+        place (str): The venue to be filtered.
+    Returns:
+        customers_behavior (pd.DataFrame): The customers features of the venue.
+    """
+    customers = customers.drop(
+        [
+            'user_home_lat', 'user_home_long', 'user_work_lat',
+            'user_work_long', 'venue_lat', 'venue_long'
+        ],
+        axis=1,
+    )
+    return customers[customers['place'] == place].drop(
+        ['device_id', 'place'], axis=1).reset_index(drop=True)
+
+
+def _describe_clusters(model: CustomerSegmentation, weights: np.ndarray,
+                       weight_column: str) -> pd.DataFrame:
+    """
+    This function summarizes the clusters of a fitted model as customer types.
+    Args:
+        model (CustomerSegmentation): The fitted model.
+        weights (np.ndarray): The sample weights used in the fit, or None.
+        weight_column (str): The name of the weight column.
     Returns:
         customer_types (pd.DataFrame): The customer types.
     """
-    kmeans = KMeans(n_clusters=n_clusters, init='k-means++', random_state=42)
-    y_kmeans = kmeans.fit_predict(data)
+    n_clusters = model.n_clusters
 
     # Showing the common values for each cluster
-    customer_types = pd.DataFrame(kmeans.cluster_centers_,
-                                  columns=data.columns)
+    customer_types = model.centroids()
+    if weights is not None:
+        customer_types[weight_column] = [
+            weights[model.labels_ == i].mean() for i in range(n_clusters)
+        ]
 
     # Assigning labels to each cluster
     customer_types['label'] = [
         'customer_type_{}'.format(i + 1) for i in range(n_clusters)
     ]
 
-    # Droping the columns that are not needed
-    customer_types.drop(['clusters'], axis=1, inplace=True)
-
     # Counting number of customers in each cluster
     customer_types['customer_pct'] = [
-        round((y_kmeans == i).sum() / len(y_kmeans) * 100, 1)
+        round((model.labels_ == i).sum() / len(model.labels_) * 100, 1)
         for i in range(n_clusters)
     ]
 
     return customer_types
+
+
+def segment_features(features: np.ndarray,
+                     weights: np.ndarray,
+                     feature_names: list,
+                     max_k: int,
+                     min_percent: float,
+                     weight_column: str = 'customer_weight') -> tuple:
+    """
+    This function selects the number of clusters of a feature matrix and keeps the model fitted with it.
+    The matrix is read as it is, so views of the memory-mapped feature store are only copied once, when standardized,
+    and the selected model is the one fitted while computing the SSE curve instead of being fitted again.
+    Args:
+        features (np.ndarray): The (n_customers, n_features) matrix of customers features.
+        weights (np.ndarray): The weight of each customer, or None.
+        feature_names (list): The names of the features.
+        max_k (int): The maximum number of clusters to be tested.
+        min_percent (float): The minimum percentage of data points that a cluster must contain.
+        weight_column (str): The name of the weight, reported in the customer types.
+    Returns:
+        model (CustomerSegmentation): The fitted model.
+        customer_types (pd.DataFrame): The customer types.
+        sse (dict): The sum of squared errors for each number of clusters tested.
+    """
+    if len(features) == 0:
+        raise ValueError('There are no customers to segment')
+
+    models, sse = _clusters_models(features, weights, max_k, min_percent,
+                                   feature_names)
+    model = models[optimal_number_clusters(sse)]
+
+    return model, _describe_clusters(model, weights, weight_column), sse
+
+
+def segment_customers(data: pd.DataFrame,
+                      max_k: int,
+                      min_percent: float,
+                      weight_column: str = 'customer_weight') -> tuple:
+    """
+    This function selects the number of clusters of a dataset and fits the segmentation model.
+    Args:
+        data (pd.DataFrame): The dataset to be used.
+        max_k (int): The maximum number of clusters to be tested.
+        min_percent (float): The minimum percentage of data points that a cluster must contain.
+        weight_column (str): The column used as sample weight instead of as a feature.
+    Returns:
+        model (CustomerSegmentation): The fitted model.
+        customer_types (pd.DataFrame): The customer types.
+        sse (dict): The sum of squared errors for each number of clusters tested.
+    """
+    features, weights = _split_weights(data, weight_column)
+    return segment_features(features, weights, list(features.columns), max_k,
+                            min_percent, weight_column)
+
+
+def update_segmentation(model: CustomerSegmentation,
+                        new_data: pd.DataFrame,
+                        data: pd.DataFrame,
+                        weight_column: str = 'customer_weight') -> pd.DataFrame:
+    """
+    This function absorbs new customers into a fitted model with mini-batch partial updates, instead of a full refit,
+    and describes the customer types of all the customers with the updated centroids.
+    Args:
+        model (CustomerSegmentation): The fitted model, updated in place.
+        new_data (pd.DataFrame): The dataset of the new customers.
+        data (pd.DataFrame): The dataset of all the customers, including the new ones.
+        weight_column (str): The column used as sample weight instead of as a feature.
+    Returns:
+        customer_types (pd.DataFrame): The customer types.
+    """
+    new_features, new_weights = _split_weights(new_data, weight_column)
+    model.partial_fit(new_features, new_weights)
+
+    features, weights = _split_weights(data, weight_column)
+    model.labels_ = model.predict(features)
+    return _describe_clusters(model, weights, weight_column)
+
+
+def get_customer_types(data: pd.DataFrame,
+                       n_clusters: int,
+                       weight_column: str = 'customer_weight') -> pd.DataFrame:
+    """
+    This function returns the customer types for a dataset.
+    Args:
+        data (pd.DataFrame): The dataset to be used.
+        n_clusters (int): The number of clusters to be used.
+        weight_column (str): The column used as sample weight instead of as a feature.
+    Returns:
+        customer_types (pd.DataFrame): The customer types.
+    """
+    features, weights = _split_weights(data, weight_column)
+    model = CustomerSegmentation(n_clusters=n_clusters).fit(features, weights)
+
+    return _describe_clusters(model, weights, weight_column)
@@ -0,0 +1,198 @@
+import argparse
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from clustering_artifacts import (
+    CLUSTERING_DIR,
+    MAX_CLUSTERS,
+    MIN_CLUSTER_PERCENT,
+    load_clustering,
+    save_clustering,
+)
+from cohorts import COHORTS_DIR, write_cohorts
+from feature_store import FEATURES_DIR, FeatureStore, write_feature_store
+from figure_cache import data_fingerprint
+from visit_index import VisitIndex
+from notebooks.custom_functions import (
+    get_customers_behavior,
+    segment_features,
+    update_segmentation,
+)
+from utils import warm_up_figures
+
+# PARAMETERS
+DATA_FILE = 'output/data.csv'
+CUSTOMERS_FILE = 'output/customers.csv'
+
+#! Pipeline steps
+
+
+def _cluster_venue(place: str, features_dir: str, output_dir: str,
+                   max_k: int, min_percent: float, fingerprint: str) -> tuple:
+    """
+    This function selects the number of clusters of a venue and stores its artifacts.
+    The features of the venue are read as a view of the memory-mapped feature store.
+    Args:
+        place (str): Venue to be clustered.
+        features_dir (str): Directory of the feature store.
+        output_dir (str): Directory with the clustering artifacts.
+        max_k (int): Maximum number of clusters to be tested.
+        min_percent (float): Minimum percentage of customers that a cluster must contain.
+        fingerprint (str): Fingerprint of the customers of the venue.
+    Returns:
+        place (str): Venue clustered.
+        n_clusters (int): Selected number of clusters.
+    """
+    store = FeatureStore(features_dir)
+    features, weights = store.features(place)
+    model, customer_types, sse = segment_features(features, weights,
+                                                  store.feature_names, max_k,
+                                                  min_percent)
+    save_clustering(output_dir, place, model, customer_types, sse,
+                    fingerprint)
+    return place, model.n_clusters
+
+
+def run_clustering(customers: pd.DataFrame,
+                   output_dir: str = CLUSTERING_DIR,
+                   max_k: int = MAX_CLUSTERS,
+                   min_percent: float = MIN_CLUSTER_PERCENT,
+                   workers: int = None,
+                   features_dir: str = FEATURES_DIR) -> dict:
+    """
+    This function writes the feature store of the customers and clusters every venue in parallel.
+    The workers map the feature store instead of receiving a copy of the customers of their venue.
+    Args:
+        customers (pd.DataFrame): Dataframe with the customers data.
+        output_dir (str): Directory with the clustering artifacts.
+        max_k (int): Maximum number of clusters to be tested.
+        min_percent (float): Minimum percentage of customers that a cluster must contain.
+        workers (int): Number of worker processes. Defaults to the number of CPUs.
+        features_dir (str): Directory of the feature store.
+    Returns:
+        n_clusters (dict): Selected number of clusters per venue.
+        failures (dict): Error of each venue that could not be clustered, without stopping the other venues.
+    """
+    store = write_feature_store(customers, features_dir,
+                                data_fingerprint(customers))
+    # The artifacts of each venue are tied to the customers of that venue only
+    fingerprints = {
+        place: data_fingerprint(place_customers)
+        for place, place_customers in customers.groupby('place')
+    }
+    n_clusters, failures = {}, {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            place: executor.submit(_cluster_venue, place, features_dir,
+                                   output_dir, max_k, min_percent,
+                                   fingerprints[place])
+            for place in store.offsets
+        }
+        for place, future in futures.items():
+            try:
+                n_clusters[place] = future.result()[1]
+            except Exception as error:
+                failures[place] = f'{type(error).__name__}: {error}'
+    return n_clusters, failures
+
+
+def update_clustering(customers: pd.DataFrame,
+                      new_customers: pd.DataFrame,
+                      output_dir: str = CLUSTERING_DIR,
+                      max_k: int = MAX_CLUSTERS,
+                      min_percent: float = MIN_CLUSTER_PERCENT,
+                      features_dir: str = FEATURES_DIR) -> dict:
+    """
+    This function absorbs the new customers of every venue into its stored model with mini-batch partial updates,
+    keeping its number of clusters, instead of selecting the number of clusters and refitting from scratch.
+    Venues without a stored model are clustered from scratch.
+    Args:
+        customers (pd.DataFrame): Dataframe with the customers data, including the new customers.
+        new_customers (pd.DataFrame): Dataframe with the customers added since the last run (e.g. the last month).
+        output_dir (str): Directory with the clustering artifacts.
+        max_k (int): Maximum number of clusters to be tested for venues without a stored model.
+        min_percent (float): Minimum percentage of customers that a cluster must contain.
+        features_dir (str): Directory of the feature store.
+    Returns:
+        n_clusters (dict): Number of clusters per venue.
+        failures (dict): Error of each venue that could not be updated, without stopping the other venues.
+    """
+    write_feature_store(customers, features_dir, data_fingerprint(customers))
+
+    n_clusters, failures = {}, {}
+    for place, place_customers in customers.groupby('place'):
+        fingerprint = data_fingerprint(place_customers)
+        try:
+            clustering = load_clustering(output_dir, place)
+            if clustering is None:
+                _, n_clusters[place] = _cluster_venue(place, features_dir,
+                                                      output_dir, max_k,
+                                                      min_percent,
+                                                      fingerprint)
+                continue
+
+            model = clustering['model']
+            customer_types = update_segmentation(
+                model, get_customers_behavior(new_customers, place),
+                get_customers_behavior(customers, place))
+            save_clustering(output_dir, place, model, customer_types,
+                            clustering['sse'], fingerprint)
+            n_clusters[place] = model.n_clusters
+        except Exception as error:
+            failures[place] = f'{type(error).__name__}: {error}'
+    return n_clusters, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Batch pipeline for the Planet Fitness customer analysis')
+    parser.add_argument('--data', default=DATA_FILE)
+    parser.add_argument('--customers', default=CUSTOMERS_FILE)
+    parser.add_argument('--clustering-dir', default=CLUSTERING_DIR)
+    parser.add_argument('--features-dir', default=FEATURES_DIR)
+    parser.add_argument('--cohorts-dir', default=COHORTS_DIR)
+    parser.add_argument('--max-k', type=int, default=MAX_CLUSTERS)
+    parser.add_argument('--min-percent',
+                        type=float,
+                        default=MIN_CLUSTER_PERCENT)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument(
+        '--new-customers',
+        default=None,
+        help='Customers added since the last run (e.g. the last month), absorbed into the stored models '
+        'with partial updates instead of a full refit')
+    parser.add_argument('--skip-warm-up',
+                        action='store_true',
+                        help='Do not pre-render the figures of the dashboard')
+    args = parser.parse_args()
+
+    customers = pd.read_csv(args.customers)
+    if args.new_customers:
+        n_clusters, failures = update_clustering(customers,
+                                       pd.read_csv(args.new_customers),
+                                       args.clustering_dir, args.max_k,
+                                       args.min_percent, args.features_dir)
+    else:
+        n_clusters, failures = run_clustering(customers, args.clustering_dir,
+                                    args.max_k, args.min_percent,
+                                    args.workers, args.features_dir)
+    for place, k in n_clusters.items():
+        print(f'{place}: {k} clusters')
+    for place, error in failures.items():
+        print(f'{place}: clustering failed ({error})')
+
+    # Sorting the visits as the dashboard does, so that the outputs are keyed by the same data fingerprint
+    data = VisitIndex(pd.read_csv(args.data)).data
+    write_cohorts(data, args.cohorts_dir, data_fingerprint(data))
+    print(f'Cohorts stored in {args.cohorts_dir}')
+
+    if not args.skip_warm_up:
+        n_selections = warm_up_figures(data, customers, args.workers)
+        print(f'{n_selections} venue selections pre-rendered')
+
+    if failures:
+        sys.exit(f'Clustering failed for {len(failures)} venues')
+
+
+if __name__ == '__main__':
+    main()
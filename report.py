@@ -0,0 +1,359 @@
+import argparse
+import hashlib
+import html
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+import pandas as pd
+from clustering_artifacts import CLUSTERING_DIR
+from figure_cache import data_fingerprint
+from pipeline import CUSTOMERS_FILE, DATA_FILE
+from utils import (
+    CONCLUSIONS,
+    FIGURE_BUILDERS,
+    load_venues,
+    render_clustering,
+    render_figures,
+    render_map,
+)
+
+# PARAMETERS
+REPORT_DIR = 'output/report'
+MANIFEST_FILE = 'manifest.json'
+ALL_VENUES = 'all'
+
+#! Subfunctions
+
+
+def _fingerprint(*parts: str) -> str:
+    """
+    This function combines several fingerprints or identifiers into one fingerprint.
+    Args:
+        parts (str): Fingerprints or identifiers to be combined.
+    Returns:
+        fingerprint (str): Hexadecimal fingerprint.
+    """
+    return hashlib.sha1('\n'.join(parts).encode()).hexdigest()
+
+
+def _clustering_fingerprint(place: str) -> str:
+    """
+    This function fingerprints the clustering artifacts of a venue, if the pipeline has stored them.
+    Args:
+        place (str): Venue of the artifacts.
+    Returns:
+        fingerprint (str): Hexadecimal fingerprint, or an empty string without artifacts.
+    """
+    selection_file = os.path.join(CLUSTERING_DIR, place, 'selection.json')
+    if not os.path.exists(selection_file):
+        return ''
+    with open(selection_file, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _page(title: str, body: str) -> str:
+    """
+    This function wraps the body of a view in a standalone HTML page.
+    Args:
+        title (str): Title of the page.
+        body (str): HTML body of the page.
+    Returns:
+        page (str): HTML page.
+    """
+    return f'''<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>{html.escape(title)}</title></head>
+<body>
+<h2>{html.escape(title)}</h2>
+{body}
+</body>
+</html>
+'''
+
+
+def _markdown_html(text: str) -> str:
+    """
+    This function converts the markdown used in the conclusions (headings, bullet lists and bold text) to HTML.
+    Args:
+        text (str): Markdown text.
+    Returns:
+        html (str): HTML text.
+    """
+    blocks = []
+    for line in text.splitlines():
+        line = re.sub(r'\*\*(.+?)\*\*', r'<strong>\1</strong>',
+                      html.escape(line.strip()))
+        heading = re.match(r'(#{1,6}) (.*)', line)
+        if heading:
+            level = len(heading.group(1))
+            blocks.append(f'<h{level}>{heading.group(2)}</h{level}>')
+        elif line.startswith('- '):
+            if not blocks or not blocks[-1].startswith('<ul>'):
+                blocks.append('<ul></ul>')
+            blocks[-1] = blocks[-1][:-len('</ul>')] + f'<li>{line[2:]}</li></ul>'
+        elif line:
+            blocks.append(f'<p>{line}</p>')
+    return '\n'.join(blocks)
+
+
+def report_views(data: pd.DataFrame, customers: pd.DataFrame,
+                 png: bool) -> List[dict]:
+    """
+    This function lists the views of the report with the fingerprint of the data each view depends on:
+    every analysis and map for all the venues and for each venue on its own, the clustering of each venue,
+    and the conclusions.
+    Args:
+        data (pd.DataFrame): Dataframe with the data.
+        customers (pd.DataFrame): Dataframe with the customers data.
+        png (bool): Whether the figures are also exported as PNG.
+    Returns:
+        views (List[dict]): Views of the report.
+    """
+    places = sorted(data['place'].unique())
+    venues_fingerprint = data_fingerprint(load_venues())
+    customers_fingerprints = {
+        place: data_fingerprint(place_customers)
+        for place, place_customers in customers.groupby('place')
+    }
+
+    # Each venue depends only on its own visits and customers
+    selections = [(ALL_VENUES, places, data_fingerprint(data, customers))]
+    for place, place_data in data.groupby('place'):
+        selections.append((place, [place],
+                           _fingerprint(data_fingerprint(place_data),
+                                        customers_fingerprints.get(place,
+                                                                   ''))))
+
+    views = []
+    for name, selected_venues, fingerprint in selections:
+        for analysis in FIGURE_BUILDERS:
+            views.append({
+                'kind': 'figures',
+                'path': os.path.join(analysis, f'{name}.html'),
+                'analysis': analysis,
+                'venues': selected_venues,
+                'png': png,
+                'fingerprint': _fingerprint(analysis, fingerprint,
+                                            venues_fingerprint, str(png)),
+            })
+        views.append({
+            'kind': 'map',
+            'path': os.path.join('map_venues', f'{name}.html'),
+            'venues': selected_venues,
+            'fingerprint': _fingerprint('map_venues', fingerprint,
+                                        venues_fingerprint),
+        })
+
+    for place in places:
+        views.append({
+            'kind': 'clustering',
+            'path': os.path.join('clustering', f'{place}.html'),
+            'venues': [place],
+            'fingerprint': _fingerprint('clustering',
+                                        customers_fingerprints.get(place, ''),
+                                        _clustering_fingerprint(place)),
+        })
+
+    views.append({
+        'kind': 'conclusions',
+        'path': 'conclusions.html',
+        'venues': [],
+        'fingerprint': _fingerprint('conclusions', CONCLUSIONS),
+    })
+    return views
+
+
+#! Rendering workers
+
+_report_data = {}
+
+
+def _set_report_data(data: pd.DataFrame, customers: pd.DataFrame,
+                     output_dir: str) -> None:
+    """
+    This function stores the data used by a report worker process, split per venue.
+    Args:
+        data (pd.DataFrame): Dataframe with the data.
+        customers (pd.DataFrame): Dataframe with the customers data.
+        output_dir (str): Directory of the report bundle.
+    """
+    _report_data['data'] = data
+    _report_data['customers'] = customers
+    _report_data['place_data'] = dict(tuple(data.groupby('place')))
+    _report_data['place_customers'] = dict(tuple(customers.groupby('place')))
+    _report_data['output_dir'] = output_dir
+
+
+def _view_data(selected_venues: List[str]) -> tuple:
+    """
+    This function returns the data and customers of a view, avoiding to scan all the venues for single-venue views.
+    Args:
+        selected_venues (List[str]): Venues of the view.
+    Returns:
+        data (pd.DataFrame): Dataframe with the data of the view.
+        customers (pd.DataFrame): Dataframe with the customers data of the view.
+    """
+    if len(selected_venues) != 1:
+        return _report_data['data'], _report_data['customers']
+    place = selected_venues[0]
+    return (_report_data['place_data'][place],
+            _report_data['place_customers'].get(
+                place, _report_data['customers'].iloc[:0]))
+
+
+def _render_view(view: dict) -> str:
+    """
+    This function renders a view of the report to its HTML file (and PNG files, if requested).
+    Args:
+        view (dict): View of the report, as listed by report_views.
+    Returns:
+        path (str): Path of the view, relative to the report bundle.
+    """
+    data, customers = _view_data(view['venues'])
+    title = view['path'][:-len('.html')].replace(os.sep, ' - ')
+    path = os.path.join(_report_data['output_dir'], view['path'])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    if view['kind'] == 'figures':
+        figures = render_figures(view['analysis'], data, view['venues'])
+        body = '\n'.join(
+            figure.to_html(full_html=False,
+                           include_plotlyjs='cdn' if i == 0 else False)
+            for i, figure in enumerate(figures))
+        if view['png']:
+            for i, figure in enumerate(figures):
+                figure.write_image(f'{path[:-len(".html")]}_{i + 1}.png')
+        content = _page(title, body)
+    elif view['kind'] == 'map':
+        content = render_map(data, customers, view['venues'])
+    elif view['kind'] == 'clustering':
+        customers_types, figure = render_clustering(customers,
+                                                    view['venues'][0])
+        content = _page(
+            title,
+            figure.to_html(full_html=False, include_plotlyjs='cdn') +
+            customers_types.to_html(index=False))
+    else:
+        content = _page('Conclusions', _markdown_html(CONCLUSIONS))
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    return view['path']
+
+
+def _write_index(output_dir: str, views: List[dict]) -> None:
+    """
+    This function writes the index page of the report bundle, linking every view.
+    Args:
+        output_dir (str): Directory of the report bundle.
+        views (List[dict]): Views of the report.
+    """
+    links = '\n'.join(
+        f'<li><a href="{html.escape(view["path"])}">{html.escape(view["path"])}</a></li>'
+        for view in views)
+    with open(os.path.join(output_dir, 'index.html'), 'w',
+              encoding='utf-8') as f:
+        f.write(_page('Planet Fitness Customer Analysis', f'<ul>\n{links}\n</ul>'))
+
+
+def export_report(data: pd.DataFrame,
+                  customers: pd.DataFrame,
+                  output_dir: str = REPORT_DIR,
+                  png: bool = False,
+                  workers: int = None,
+                  force: bool = False) -> tuple:
+    """
+    This function renders every view of the dashboard to a static report bundle, in parallel.
+    Views whose data fingerprint has not changed since the last export are skipped.
+    Args:
+        data (pd.DataFrame): Dataframe with the data.
+        customers (pd.DataFrame): Dataframe with the customers data.
+        output_dir (str): Directory of the report bundle.
+        png (bool): Whether the figures are also exported as PNG (requires kaleido).
+        workers (int): Number of worker processes. Defaults to the number of CPUs.
+        force (bool): Whether to render all the views, even if they have not changed.
+    Returns:
+        n_rendered (int): Number of views rendered.
+        n_skipped (int): Number of views skipped.
+        failures (dict): Error of each view that could not be rendered, without stopping the other views.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_file = os.path.join(output_dir, MANIFEST_FILE)
+    manifest = {}
+    if os.path.exists(manifest_file) and not force:
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+
+    views = report_views(data, customers, png)
+    pending = [
+        view for view in views
+        if manifest.get(view['path']) != view['fingerprint']
+        or not os.path.exists(os.path.join(output_dir, view['path']))
+    ]
+
+    failures = {}
+    try:
+        if pending:
+            with ProcessPoolExecutor(max_workers=workers,
+                                     initializer=_set_report_data,
+                                     initargs=(data, customers,
+                                               output_dir)) as executor:
+                futures = {
+                    view['path']: (view['fingerprint'],
+                                   executor.submit(_render_view, view))
+                    for view in pending
+                }
+                for path, (fingerprint, future) in futures.items():
+                    try:
+                        future.result()
+                        manifest[path] = fingerprint
+                    except Exception as error:
+                        failures[path] = f'{type(error).__name__}: {error}'
+    finally:
+        # The views rendered so far are kept in the manifest even if the export is interrupted
+        _write_index(output_dir,
+                     [view for view in views if view['path'] not in failures])
+        with open(manifest_file, 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+    return len(pending) - len(failures), len(views) - len(pending), failures
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Export all the analyses of the dashboard to a static report')
+    parser.add_argument('--data', default=DATA_FILE)
+    parser.add_argument('--customers', default=CUSTOMERS_FILE)
+    parser.add_argument('--output', default=REPORT_DIR)
+    parser.add_argument('--png',
+                        action='store_true',
+                        help='Also export the figures as PNG (requires kaleido)')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--force',
+                        action='store_true',
+                        help='Render all the views, even if they have not changed')
+    args = parser.parse_args()
+
+    if args.png:
+        try:
+            import kaleido  # noqa: F401
+        except ImportError:
+            parser.error('exporting PNG files requires kaleido: pip install kaleido')
+
+    data = pd.read_csv(args.data)
+    customers = pd.read_csv(args.customers)
+    n_rendered, n_skipped, failures = export_report(data, customers,
+                                                    args.output, args.png,
+                                                    args.workers, args.force)
+    print(f'{n_rendered} views rendered, {n_skipped} unchanged views skipped')
+    for path, error in failures.items():
+        print(f'{path}: {error}')
+    if failures:
+        sys.exit(f'Rendering failed for {len(failures)} views')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, List, Tuple
+import pandas as pd
+from visit_index import VisitIndex
+
+
+def make_read_only(frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    This function marks the arrays backing a dataframe as read-only, so that a dataframe shared
+    by several sessions cannot be modified in place by any of them.
+    Args:
+        frame (pd.DataFrame): Dataframe to be shared.
+    Returns:
+        frame (pd.DataFrame): The same dataframe, backed by read-only arrays.
+    """
+    for column in frame.columns:
+        values = frame[column].to_numpy()
+        # The columns are views of the 2D blocks of the dataframe, which are the arrays to protect
+        base = values.base if values.base is not None else values
+        base.setflags(write=False)
+        values.setflags(write=False)
+    return frame
+
+
+class SharedCache:
+    """
+    Thread-safe memoization cache, shared by all the sessions of the server process, with LRU eviction.
+    Each value is computed once, even when several sessions request it at the same time: the other
+    sessions wait for it instead of computing it again.
+    Args:
+        max_entries (int): Maximum number of values kept.
+    """
+
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._values = OrderedDict()
+        self._pending = {}
+
+    def get(self, key: Hashable, compute: Callable):
+        """
+        This function returns the value of a key, computing it if it is not cached.
+        Args:
+            key (Hashable): Key of the value.
+            compute (Callable): Function computing the value.
+        Returns:
+            value: The cached or computed value.
+        """
+        with self._lock:
+            if key in self._values:
+                self._values.move_to_end(key)
+                return self._values[key]
+            key_lock = self._pending.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # Another session may have computed the value while waiting for the key lock
+            with self._lock:
+                if key in self._values:
+                    self._values.move_to_end(key)
+                    return self._values[key]
+            try:
+                value = compute()
+                with self._lock:
+                    self._values[key] = value
+                    while len(self._values) > self.max_entries:
+                        self._values.popitem(last=False)
+            finally:
+                with self._lock:
+                    self._pending.pop(key, None)
+        return value
+
+
+class SharedData:
+    """
+    Tables of the dashboard loaded once per server process and shared, read-only, by all the sessions,
+    together with the windows of visits requested by the sessions and the progress of the background warm-up.
+    Args:
+        data_file (str): Name of the data file.
+        customers_file (str): Name of the customers file.
+    """
+
+    def __init__(self, data_file: str, customers_file: str):
+        self.visits = VisitIndex(pd.read_csv(data_file))
+        self.customers = pd.read_csv(customers_file)
+        make_read_only(self.visits.data)
+        make_read_only(self.customers)
+
+        self._windows = SharedCache(max_entries=32)
+        self.warm_up_progress = 0.0
+        self.warm_up_status = 'Warm-up pending'
+        self.warm_up_errors = []
+
+    def window(self, start=None, end=None) -> pd.DataFrame:
+        """
+        This function returns the visits within a time window, sharing the same dataframe among the sessions
+        that select the same window.
+        Args:
+            start: Start of the window, included. Defaults to the first visit.
+            end: End of the window, excluded. Defaults to after the last visit.
+        Returns:
+            data (pd.DataFrame): Dataframe with the visits of the window.
+        """
+        return self._windows.get(
+            (start, end), lambda: make_read_only(self.visits.window(start, end)))
+
+    def start_warm_up(self, tasks: List[Tuple[str, Callable]]) -> threading.Thread:
+        """
+        This function runs warm-up tasks in a background thread, reporting their progress.
+        Args:
+            tasks (List[Tuple[str, Callable]]): Description and function of each task.
+        Returns:
+            thread (threading.Thread): The warm-up thread.
+        """
+
+        def warm_up():
+            for i, (description, task) in enumerate(tasks):
+                self.warm_up_status = description
+                try:
+                    task()
+                except Exception as error:
+                    # A failed task is computed again by the first session needing it
+                    self.warm_up_errors.append(f'{description}: {error}')
+                self.warm_up_progress = (i + 1) / len(tasks)
+            self.warm_up_status = 'Warm-up done'
+
+        thread = threading.Thread(target=warm_up, name='warm-up', daemon=True)
+        thread.start()
+        return thread
@@ -1,22 +1,201 @@
+import datetime
 import streamlit as st
+import streamlit.components.v1 as components
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
 import folium
+from concurrent.futures import ProcessPoolExecutor
 from typing import List
-from streamlit_folium import st_folium
 from notebooks.custom_functions import (
-    optimal_clusters_sse,
-    get_customer_types,
-    get_customer_types,
+    get_customers_behavior,
+    segment_customers,
+    segment_features,
+    venue_key,
+    venue_name,
+)
+from cohorts import (
+    COHORTS_DIR,
+    cohort_retention,
+    gap_labels,
+    inter_visit_gaps,
+    load_cohorts,
+)
+from feature_store import FEATURES_DIR, FeatureStore
+from figure_cache import FigureCache, data_fingerprint
+from shared_data import SharedCache, SharedData, make_read_only
+from clustering_artifacts import (
+    CLUSTERING_DIR,
+    MAX_CLUSTERS,
+    MIN_CLUSTER_PERCENT,
+    load_clustering,
 )
 
 # PARAMETERS
-COLOR_DISCRETE_SEQUENCE = ["blue", "orange", "green", "red"]
+VENUES_FILE = 'data/venues_info.csv'
+# Colors valid both in plotly and in folium icons, cycled over the venues
+VENUE_COLORS = [
+    'blue', 'orange', 'green', 'red', 'purple', 'darkred', 'beige', 'darkblue',
+    'darkgreen', 'cadetblue', 'pink', 'lightblue', 'lightgreen', 'gray',
+    'black', 'lightgray'
+]
+# Number of venues with more estimated visits selected by default
+TOP_VENUES = 5
+# Line charts are drawn with WebGL (Scattergl), so that they stay fast with many venues
+RENDER_MODE = 'webgl'
+# Rendered figures and maps, shared by all the sessions and by the warm-up of the pipeline
+FIGURE_CACHE = FigureCache()
+# Aggregated visits and clustering results, shared by all the sessions of the server process
+AGGREGATES_CACHE = SharedCache(max_entries=256)
+CLUSTERING_CACHE = SharedCache(max_entries=256)
 
 #! Subfunctions
 
 
+@st.cache_data
+def load_venues(file_name: str = VENUES_FILE) -> pd.DataFrame:
+    """
+    This function loads the venues metadata, assigning a place, a label and a color to each venue.
+    Args:
+        file_name (str): Name of the venues metadata file.
+    Returns:
+        venues (pd.DataFrame): Dataframe with one row per venue, sorted by place.
+    """
+    venues = pd.read_csv(file_name)
+    # The place is the key of the venues in the data, and rows with the same address are the same venue
+    venues['place'] = venues['venue_address'].apply(venue_key)
+    venues = venues.drop_duplicates('place')
+
+    # Venues with the same short name are labelled with their address instead
+    venues['label'] = venues['venue_address'].apply(venue_name)
+    shared_label = venues['label'].duplicated(keep=False)
+    venues.loc[shared_label, 'label'] = venues.loc[shared_label,
+                                                   'venue_address']
+    venues = venues.sort_values('place').reset_index(drop=True)
+    venues['color'] = [
+        VENUE_COLORS[i % len(VENUE_COLORS)] for i in range(len(venues))
+    ]
+    return venues
+
+
+@st.cache_resource
+def load_shared_data(data_file: str, customers_file: str) -> SharedData:
+    """
+    This function loads the data once per server process, shared read-only by all the sessions,
+    and starts the background warm-up of the aggregates and the clustering of every venue.
+    Args:
+        data_file (str): Name of the data file.
+        customers_file (str): Name of the customers file.
+    Returns:
+        shared (SharedData): Data shared by all the sessions.
+    """
+    shared = SharedData(data_file, customers_file)
+
+    # Loading the JSON engine of plotly (orjson, when installed) before the warm-up thread and the sessions
+    # read cached figures at the same time, since plotly imports it lazily and the import is not thread-safe
+    pio.from_json(go.Figure().to_json())
+
+    shared.start_warm_up(_warm_up_tasks(shared))
+    return shared
+
+
+def show_warm_up_progress(shared: SharedData) -> None:
+    """
+    This function shows the progress of the background warm-up in the sidebar, until it is done,
+    and the warm-up tasks that failed.
+    Args:
+        shared (SharedData): Data shared by all the sessions.
+    """
+    if shared.warm_up_progress < 1:
+        st.sidebar.progress(shared.warm_up_progress,
+                            text=shared.warm_up_status)
+    if shared.warm_up_errors:
+        st.sidebar.warning(
+            'Some results could not be precomputed, they will be computed when shown:  \n' +
+            '  \n'.join(shared.warm_up_errors))
+
+
+def select_date_window(shared: SharedData) -> pd.DataFrame:
+    """
+    This function allows the user to select the date range of all the analyses.
+    Args:
+        shared (SharedData): Data shared by all the sessions.
+    Returns:
+        data (pd.DataFrame): Dataframe with the visits in the selected date range.
+    """
+    first_date, last_date = shared.visits.start.date(), shared.visits.end.date()
+    date_range = st.sidebar.date_input(
+        'Select date range',
+        value=(first_date, last_date),
+        min_value=first_date,
+        max_value=last_date,
+    )
+
+    # While the range is being selected, only its start date is available
+    if not isinstance(date_range, (tuple, list)) or len(date_range) != 2:
+        return shared.window()
+
+    start_date, end_date = date_range
+    if (start_date, end_date) == (first_date, last_date):
+        return shared.window()
+    return shared.window(start_date, end_date + datetime.timedelta(days=1))
+
+
+@st.cache_resource
+def load_feature_store(directory: str = FEATURES_DIR) -> FeatureStore:
+    """
+    This function maps the feature store of the pipeline once per server process.
+    Args:
+        directory (str): Directory of the feature store.
+    Returns:
+        store (FeatureStore): The feature store, or None if the pipeline has not written it.
+    """
+    return FeatureStore.open(directory)
+
+
+def _venue_colors() -> dict:
+    """
+    This function returns the color of each venue.
+    Returns:
+        colors (dict): Dictionary with the color of each place.
+    """
+    venues = load_venues()
+    return dict(zip(venues['place'], venues['color']))
+
+
+def _venue_labels() -> dict:
+    """
+    This function returns the label of each venue, shown instead of its place.
+    Returns:
+        labels (dict): Dictionary with the label of each place.
+    """
+    venues = load_venues()
+    return dict(zip(venues['place'], venues['label']))
+
+
+def _label_venues(figures: List[go.Figure]) -> List[go.Figure]:
+    """
+    This function shows the label of the venues instead of their place in the legend and hover of the figures.
+    Args:
+        figures (List[go.Figure]): Figures with a trace per place.
+    Returns:
+        figures (List[go.Figure]): The same figures, labelled.
+    """
+    labels = _venue_labels()
+    for figure in figures:
+        for trace in figure.data:
+            if trace.name not in labels:
+                continue
+            label = labels[trace.name]
+            if trace.hovertemplate:
+                trace.hovertemplate = trace.hovertemplate.replace(
+                    f'place={trace.name}', f'place={label}')
+            trace.name = label
+    return figures
+
+
 # _grouping_data that returns grouped_visits, grouped_customers
 def _grouping_visits(data: pd.DataFrame, column: str) -> pd.DataFrame:
     """
@@ -27,11 +206,12 @@ def _grouping_visits(data: pd.DataFrame, column: str) -> pd.DataFrame:
     Returns:
         grouped_visits (pd.DataFrame): Dataframe with the grouped visits.
     """
-    grouped_visits = data.groupby(['place', column]).agg({
-        'visit_weight': 'sum'
-    }).reset_index()
-
-    return grouped_visits
+    return AGGREGATES_CACHE.get(
+        ('visits', data_fingerprint(data), column),
+        lambda: make_read_only(
+            data.groupby(['place', column]).agg({
+                'visit_weight': 'sum'
+            }).reset_index()))
 
 
 def _grouping_customers(data: pd.DataFrame, column: str) -> pd.DataFrame:
@@ -43,56 +223,708 @@ def _grouping_customers(data: pd.DataFrame, column: str) -> pd.DataFrame:
     Returns:
         grouped_customers (pd.DataFrame): Dataframe with the grouped customers.
     """
-    grouped_customers = data.groupby(['place', 'device_id']).agg({
-        column:
-        'mean',
-        'customer_weight':
-        'first'
-    }).groupby(['place', column]).agg({
-        'customer_weight': 'sum'
-    }).reset_index()
+    return AGGREGATES_CACHE.get(
+        ('customers', data_fingerprint(data), column),
+        lambda: make_read_only(
+            data.groupby(['place', 'device_id']).agg({
+                column: 'mean',
+                'customer_weight': 'first'
+            }).groupby(['place', column]).agg({
+                'customer_weight': 'sum'
+            }).reset_index()))
+
+
+def _cohort_tables(data: pd.DataFrame) -> tuple:
+    """
+    This function returns the cohort retention and the time between visits of the venues,
+    loading them from the outputs of the pipeline when they were computed from the same data.
+    Args:
+        data (pd.DataFrame): Dataframe with the data.
+    Returns:
+        retention (pd.DataFrame): Dataframe with the cohort retention.
+        gaps (pd.DataFrame): Dataframe with the distribution of the time between visits.
+    """
+
+    def compute() -> tuple:
+        cohorts = load_cohorts(COHORTS_DIR, fingerprint)
+        if cohorts is None:
+            cohorts = cohort_retention(data), inter_visit_gaps(data)
+        return tuple(make_read_only(table) for table in cohorts)
 
-    return grouped_customers
+    fingerprint = data_fingerprint(data)
+    return AGGREGATES_CACHE.get(('cohorts', fingerprint), compute)
+
+
+def _default_venues(data: pd.DataFrame) -> List[str]:
+    """
+    This function returns the venues selected by default: the top venues plus the venues to compare with.
+    Args:
+        data (pd.DataFrame): Dataframe with the data.
+    Returns:
+        default_venues (List[str]): List of venues selected by default.
+    """
+    venues = load_venues()
+    top_venues = AGGREGATES_CACHE.get(
+        ('top_venues', data_fingerprint(data), TOP_VENUES),
+        lambda: data.groupby('place')['visit_weight'].sum().nlargest(
+            TOP_VENUES).index)
+    noted_venues = venues.loc[venues['notes'].notna(), 'place']
+    return sorted(
+        set(top_venues).union(noted_venues).intersection(venues['place']))
 
 
 def _multi_select_venues(data: pd.DataFrame) -> List[str]:
     """
     This function allows the user to select venues to plot.
+    By default, the venues with more estimated visits and the venues with notes (e.g. underperforming) are selected.
     Args:
         data (pd.DataFrame): Dataframe with the data.
     Returns:
         list of selected venues (List[str]): List of selected venues.
     """
     # Get the list of venues
+    venues = load_venues()
+    options = {
+        place: label if label == address else f'{label} - {address}'
+        for place, label, address in zip(venues['place'], venues['label'],
+                                         venues['venue_address'])
+    }
+
+    # Create a searchable multiselect widget to select venues, shared by all the analyses
+    selected_venues = st.multiselect(
+        'Select venues to plot',
+        list(options),
+        default=_default_venues(data),
+        format_func=options.get,
+        key='selected_venues',
+    )
+    return selected_venues
+
+
+def _one_select_venue(data: pd.DataFrame) -> str:
+    """
+    This function allows the user to select a venue to plot.
+    Args:
+        data (pd.DataFrame): Dataframe with the data.
+    Returns:
+        selected_venue (str): Selected venue.
+    """
+    # Get the list of venues
     venues = data['place'].unique()
     venues.sort()
+    labels = _venue_labels()
+
+    # Create a single select widget to select venues
+    selected_venue = st.selectbox(
+        'Select venue to plot',
+        venues,
+        index=0,
+        format_func=lambda place: labels.get(place, place),
+    )
+    return selected_venue
+
+
+#! Figures
+
+
+def _date_level_figures(data: pd.DataFrame, column: str,
+                        selected_venues: List[str]) -> List[go.Figure]:
+    """
+    This function builds the figures of the analysis at date level.
+    Args:
+        data (pd.DataFrame): Dataframe with the data.
+        column (str): Column to group by.
+        selected_venues (List[str]): Venues to plot.
+    Returns:
+        figures (List[go.Figure]): Figures of the analysis.
+    """
+    # Grouping data
+    grouped_visits = _grouping_visits(data, column)
+
+    # Filtering data for selected venues
+    grouped_visits = grouped_visits[grouped_visits['place'].isin(
+        selected_venues)]
+
+    # Plotting
+    fig_visits = px.line(grouped_visits,
+                         x='start_date',
+                         y='visit_weight',
+                         color='place',
+                         title='Total estimated visits over time',
+                         render_mode=RENDER_MODE,
+                         color_discrete_map=_venue_colors())
+
+    return [fig_visits]
+
+
+def _hour_level_figures(data: pd.DataFrame, column: str,
+                        selected_venues: List[str]) -> List[go.Figure]:
+    """
+    This function builds the figures of the analysis at hour level.
+    Args:
+        data (pd.DataFrame): Dataframe with the data.
+        column (str): Column to group by.
+        selected_venues (List[str]): Venues to plot.
+    Returns:
+        figures (List[go.Figure]): Figures of the analysis.
+    """
+    # Grouping data
+    grouped_visits = _grouping_visits(data, column)
+
+    # Filtering data for selected venues
+    grouped_visits = grouped_visits[grouped_visits['place'].isin(
+        selected_venues)]
+
+    # Plotting
+    fig_visits = px.line(grouped_visits,
+                         x='visit_hour',
+                         y='visit_weight',
+                         color='place',
+                         title='Average estimated visits over time',
+                         render_mode=RENDER_MODE,
+                         color_discrete_map=_venue_colors())
+
+    return [fig_visits]
+
+
+def _day_week_level_figures(data: pd.DataFrame, column: str,
+                            selected_venues: List[str]) -> List[go.Figure]:
+    """
+    This function builds the figures of the analysis at day of week level.
+    Args:
+        data (pd.DataFrame): Dataframe with the data.
+        column (str): Column to group by.
+        selected_venues (List[str]): Venues to plot.
+    Returns:
+        figures (List[go.Figure]): Figures of the analysis.
+    """
+    # Grouping data
+    categories_order = [
+        'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday',
+        'Sunday'
+    ]
+
+    # Grouping data
+    grouped_visits = _grouping_visits(data, column)
+
+    # Filtering data for selected venues
+    grouped_visits = grouped_visits[grouped_visits['place'].isin(
+        selected_venues)]
+
+    # Ordering data
+    grouped_visits['to_sort'] = grouped_visits['day_of_week'].apply(
+        lambda x: categories_order.index(x))
+    grouped_visits = grouped_visits.sort_values(by='to_sort')
+
+    # Plotting
+    fig_visits = px.line(grouped_visits,
+                         x='day_of_week',
+                         y='visit_weight',
+                         color='place',
+                         title='Average estimated visits over time',
+                         render_mode=RENDER_MODE,
+                         color_discrete_map=_venue_colors())
+
+    return [fig_visits]
+
+
+def _weekend_level_figures(data: pd.DataFrame, column: str,
+                           selected_venues: List[str]) -> List[go.Figure]:
+    """
+    This function builds the figures of the analysis at weekend level.
+    Args:
+        data (pd.DataFrame): Dataframe with the data.
+        column (str): Column to group by.
+        selected_venues (List[str]): Venues to plot.
+    Returns:
+        figures (List[go.Figure]): Figures of the analysis.
+    """
+    # Grouping data
+    grouped_visits = _grouping_visits(data, column)
+
+    # Filtering data for selected venues
+    grouped_visits = grouped_visits[grouped_visits['place'].isin(
+        selected_venues)]
+
+    # Plotting
+    fig_visits = px.bar(grouped_visits,
+                        x='weekend',
+                        y='visit_weight',
+                        color='place',
+                        title='Average estimated visits over time',
+                        barmode='group',
+                        color_discrete_map=_venue_colors())
+
+    return [fig_visits]
+
+
+def _month_level_figures(data: pd.DataFrame, column: str,
+                         selected_venues: List[str]) -> List[go.Figure]:
+    """
+    This function builds the figures of the analysis at month level.
+    Args:
+        data (pd.DataFrame): Dataframe with the data.
+        column (str): Column to group by.
+        selected_venues (List[str]): Venues to plot.
+    Returns:
+        figures (List[go.Figure]): Figures of the analysis.
+    """
+    # Grouping data
+    categories_order = [
+        'January', 'February', 'March', 'April', 'May', 'June', 'July',
+        'August', 'September', 'October', 'November', 'December'
+    ]
+
+    # Grouping data
+    grouped_visits = _grouping_visits(data, column)
+
+    # Filtering data for selected venues
+    grouped_visits = grouped_visits[grouped_visits['place'].isin(
+        selected_venues)]
+
+    # Ordering data
+    grouped_visits['to_sort'] = grouped_visits['month'].apply(
+        lambda x: categories_order.index(x))
+    grouped_visits = grouped_visits.sort_values(by='to_sort')
+
+    # Plotting
+    fig_visits = px.line(grouped_visits,
+                         x='month',
+                         y='visit_weight',
+                         color='place',
+                         title='Average estimated visits over time',
+                         render_mode=RENDER_MODE,
+                         color_discrete_map=_venue_colors())
+
+    return [fig_visits]
+
+
+def _distance_from_home_level_figures(data: pd.DataFrame, column: str,
+                                      selected_venues: List[str]) -> List[go.Figure]:
+    """
+    This function builds the figures of the analysis at distance from home level.
+    Args:
+        data (pd.DataFrame): Dataframe with the data.
+        column (str): Column to group by.
+        selected_venues (List[str]): Venues to plot.
+    Returns:
+        figures (List[go.Figure]): Figures of the analysis.
+    """
+    # Grouping data
+    grouped_visits = _grouping_visits(data, column)
+    grouped_customers = _grouping_customers(data, column)
+
+    # Filtering data for selected venues
+    grouped_visits = grouped_visits[grouped_visits['place'].isin(
+        selected_venues)]
+    grouped_customers = grouped_customers[grouped_customers['place'].isin(
+        selected_venues)]
+
+    # Plotting
+    fig_visits = px.histogram(
+        grouped_visits,
+        x='distance_from_home_miles',
+        color='place',
+        title='Distribution of distance from home for visits',
+        barmode='overlay',
+        color_discrete_map=_venue_colors())
+    fig_customers = px.histogram(
+        grouped_customers,
+        x='distance_from_home_miles',
+        color='place',
+        title='Distribution of distance from home for customers',
+        barmode='overlay',
+        color_discrete_map=_venue_colors())
+
+    return [fig_visits, fig_customers]
+
+
+def _distance_from_work_level_figures(data: pd.DataFrame, column: str,
+                                      selected_venues: List[str]) -> List[go.Figure]:
+    """
+    This function builds the figures of the analysis at distance from work level.
+    Args:
+        data (pd.DataFrame): Dataframe with the data.
+        column (str): Column to group by.
+        selected_venues (List[str]): Venues to plot.
+    Returns:
+        figures (List[go.Figure]): Figures of the analysis.
+    """
+    # Grouping data
+    grouped_visits = _grouping_visits(data, column)
+    grouped_customers = _grouping_customers(data, column)
+
+    # Filtering data for selected venues
+    grouped_visits = grouped_visits[grouped_visits['place'].isin(
+        selected_venues)]
+    grouped_customers = grouped_customers[grouped_customers['place'].isin(
+        selected_venues)]
+
+    # Plotting
+    fig_visits = px.histogram(
+        grouped_visits,
+        x='distance_from_work_miles',
+        color='place',
+        title='Distribution of distance from work for visits',
+        barmode='overlay',
+        color_discrete_map=_venue_colors())
+    fig_customers = px.histogram(
+        grouped_customers,
+        x='distance_from_work_miles',
+        color='place',
+        title='Distribution of distance from work for customers',
+        barmode='overlay',
+        color_discrete_map=_venue_colors())
+
+    return [fig_visits, fig_customers]
+
+
+def _cohort_level_figures(data: pd.DataFrame, column: str,
+                          selected_venues: List[str]) -> List[go.Figure]:
+    """
+    This function builds the figures of the cohort analysis: the retention of the customers by month since
+    their first visit, the retention of every cohort of first-visit month, and the time between visits.
+    Args:
+        data (pd.DataFrame): Dataframe with the data.
+        column (str): Column with the start time of the visits.
+        selected_venues (List[str]): Venues to plot.
+    Returns:
+        figures (List[go.Figure]): Figures of the analysis.
+    """
+    # Grouping data
+    retention, gaps = _cohort_tables(data)
+
+    # Filtering data for selected venues
+    retention = retention[retention['place'].isin(selected_venues)]
+    gaps = gaps[gaps['place'].isin(selected_venues)]
+
+    # Weighted retention of all the cohorts of each venue
+    grouped_retention = retention.groupby(['place', 'months_since_first'])[[
+        'weight', 'cohort_weight'
+    ]].sum().reset_index()
+    grouped_retention['retention'] = grouped_retention[
+        'weight'] / grouped_retention['cohort_weight']
+
+    # Plotting
+    fig_retention = px.line(
+        grouped_retention,
+        x='months_since_first',
+        y='retention',
+        color='place',
+        markers=True,
+        title='Weighted retention of customers by month since their first visit',
+        render_mode=RENDER_MODE,
+        color_discrete_map=_venue_colors())
+
+    places = sorted(retention['place'].unique())
+    if places:
+        cohorts = retention.pivot_table(index=['place', 'cohort'],
+                                        columns='months_since_first',
+                                        values='retention')
+        cohort_months = sorted(retention['cohort'].unique())
+        matrices = [
+            cohorts.loc[place].reindex(cohort_months).to_numpy()
+            for place in places
+        ]
+        fig_cohorts = px.imshow(
+            np.stack(matrices),
+            facet_col=0,
+            facet_col_wrap=2,
+            x=list(cohorts.columns),
+            y=cohort_months,
+            zmin=0,
+            zmax=1,
+            color_continuous_scale='Blues',
+            labels={
+                'x': 'Months since first visit',
+                'y': 'Cohort (first visit month)',
+                'color': 'Retention'
+            },
+            title='Weighted retention of each cohort of first visit month')
+        labels = _venue_labels()
+        titles = [labels.get(place, place) for place in places]
+        fig_cohorts.for_each_annotation(lambda annotation: annotation.update(
+            text=titles[int(annotation.text.split('=')[-1])]))
+    else:
+        fig_cohorts = go.Figure()
+
+    fig_gaps = px.bar(gaps,
+                      x='gap_days',
+                      y='pct',
+                      color='place',
+                      barmode='group',
+                      category_orders={'gap_days': gap_labels()},
+                      labels={
+                          'gap_days': 'Days since the previous visit',
+                          'pct': '% of weighted visits'
+                      },
+                      title='Distribution of the time between visits',
+                      color_discrete_map=_venue_colors())
+
+    return [fig_retention, fig_cohorts, fig_gaps]
+
+
+FIGURE_BUILDERS = {
+    'date_level': _date_level_figures,
+    'hour_level': _hour_level_figures,
+    'day_week_level': _day_week_level_figures,
+    'weekend_level': _weekend_level_figures,
+    'month_level': _month_level_figures,
+    'distance_from_home_level': _distance_from_home_level_figures,
+    'distance_from_work_level': _distance_from_work_level_figures,
+    'cohort_level': _cohort_level_figures,
+}
+
+
+def _cached_figures(analysis: str, data: pd.DataFrame, column: str,
+                    selected_venues: List[str]) -> List[go.Figure]:
+    """
+    This function returns the figures of an analysis from the figure cache, building them if needed.
+    Args:
+        analysis (str): Name of the analysis, in FIGURE_BUILDERS.
+        data (pd.DataFrame): Dataframe with the data.
+        column (str): Column to group by.
+        selected_venues (List[str]): Venues to plot.
+    Returns:
+        figures (List[go.Figure]): Figures of the analysis.
+    """
+    build = FIGURE_BUILDERS[analysis]
+    return FIGURE_CACHE.figures(
+        f'{analysis}:{column}', selected_venues,
+        data_fingerprint(data, load_venues()),
+        lambda: _label_venues(build(data, column, selected_venues)))
+
+
+def _cached_map(data: pd.DataFrame, customers: pd.DataFrame,
+                selected_venues: List[str]) -> str:
+    """
+    This function returns the HTML of the map of the selected venues from the figure cache, building it if needed.
+    Args:
+        data (pd.DataFrame): Dataframe with the data.
+        customers (pd.DataFrame): Dataframe with the customers data.
+        selected_venues (List[str]): Venues to plot.
+    Returns:
+        html (str): HTML of the map.
+    """
+    return FIGURE_CACHE.html(
+        'map_venues', selected_venues,
+        data_fingerprint(data, customers, load_venues()),
+        lambda: render_map(data, customers, selected_venues))
+
+
+# Column grouped by each analysis in the dashboard
+FIGURE_COLUMNS = {
+    'date_level': 'start_date',
+    'hour_level': 'visit_hour',
+    'day_week_level': 'day_of_week',
+    'weekend_level': 'weekend',
+    'month_level': 'month',
+    'distance_from_home_level': 'distance_from_home_miles',
+    'distance_from_work_level': 'distance_from_work_miles',
+    'cohort_level': 'visit_start_time',
+}
+
+_warm_up_data = {}
+
+
+def _set_warm_up_data(data: pd.DataFrame, customers: pd.DataFrame) -> None:
+    """
+    This function stores the data used by a warm-up worker process.
+    Args:
+        data (pd.DataFrame): Dataframe with the data.
+        customers (pd.DataFrame): Dataframe with the customers data.
+    """
+    _warm_up_data['data'] = data
+    _warm_up_data['customers'] = customers
+
+
+def _warm_up_selection(selected_venues: List[str]) -> None:
+    """
+    This function renders all the figures and the map of a venue selection into the figure cache.
+    Args:
+        selected_venues (List[str]): Venues to plot.
+    """
+    data, customers = _warm_up_data['data'], _warm_up_data['customers']
+    for analysis, column in FIGURE_COLUMNS.items():
+        _cached_figures(analysis, data, column, selected_venues)
+    _cached_map(data, customers, selected_venues)
+
+
+def warm_up_figures(data: pd.DataFrame,
+                    customers: pd.DataFrame,
+                    workers: int = None) -> int:
+    """
+    This function pre-renders the common venue selections into the figure cache, in parallel:
+    the default selection, all the venues, and every venue on its own.
+    Args:
+        data (pd.DataFrame): Dataframe with the data.
+        customers (pd.DataFrame): Dataframe with the customers data.
+        workers (int): Number of worker processes. Defaults to the number of CPUs.
+    Returns:
+        n_selections (int): Number of venue selections rendered.
+    """
+    places = sorted(data['place'].unique())
+    selections = {tuple(_default_venues(data)), tuple(places)}
+    selections.update((place, ) for place in places)
+
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_set_warm_up_data,
+                             initargs=(data, customers)) as executor:
+        list(executor.map(_warm_up_selection, map(list, selections)))
+    return len(selections)
+
+
+def _warm_up_tasks(shared: SharedData) -> List[tuple]:
+    """
+    This function lists the warm-up tasks of the server: the aggregates and the figures of the default
+    venue selection for the whole date range, and the clustering of every venue.
+    Args:
+        shared (SharedData): Data shared by all the sessions.
+    Returns:
+        tasks (List[tuple]): Description and function of each task.
+    """
+    data, customers = shared.window(), shared.customers
+    tasks = [
+        (f'Rendering {analysis}',
+         lambda analysis=analysis, column=column: _cached_figures(
+             analysis, data, column, _default_venues(data)))
+        for analysis, column in FIGURE_COLUMNS.items()
+    ]
+    labels = _venue_labels()
+    tasks += [(f'Clustering {labels.get(place, place)}',
+               lambda place=place: render_clustering(customers, place))
+              for place in sorted(customers['place'].unique())]
+    return tasks
+
+
+#! Headless rendering
+
+
+def render_figures(analysis: str, data: pd.DataFrame,
+                   selected_venues: List[str]) -> List[go.Figure]:
+    """
+    This function builds the figures of an analysis without the figure cache.
+    Args:
+        analysis (str): Name of the analysis, in FIGURE_BUILDERS.
+        data (pd.DataFrame): Dataframe with the data.
+        selected_venues (List[str]): Venues to plot.
+    Returns:
+        figures (List[go.Figure]): Figures of the analysis.
+    """
+    return _label_venues(FIGURE_BUILDERS[analysis](data,
+                                                   FIGURE_COLUMNS[analysis],
+                                                   selected_venues))
+
+
+def render_map(data: pd.DataFrame, customers: pd.DataFrame,
+               selected_venues: List[str]) -> str:
+    """
+    This function builds the HTML of the map of the selected venues without the figure cache.
+    Args:
+        data (pd.DataFrame): Dataframe with the data.
+        customers (pd.DataFrame): Dataframe with the customers data.
+        selected_venues (List[str]): Venues to plot.
+    Returns:
+        html (str): HTML of the map.
+    """
+    return _venues_map(data, customers, selected_venues).get_root().render()
+
+
+def _venue_clustering(customers: pd.DataFrame, place: str) -> tuple:
+    """
+    This function loads the clustering artifacts of a venue if they were computed from its current customers,
+    or clusters its customers on the fly,
+    reading their features from the feature store when it is up to date.
+    Args:
+        customers (pd.DataFrame): Dataframe with the customers data.
+        place (str): Venue to be clustered.
+    Returns:
+        customers_types (pd.DataFrame): Customer types of the venue.
+        sse (dict): Sum of squared errors for each number of clusters tested.
+    """
+    place_customers = customers[customers['place'].isin([place])]
+    clustering = load_clustering(CLUSTERING_DIR, place,
+                                 data_fingerprint(place_customers))
+    if clustering is not None:
+        return make_read_only(clustering['customer_types']), clustering['sse']
+
+    store = load_feature_store()
+    if (store is not None and place in store.offsets
+            and store.fingerprint == data_fingerprint(customers)):
+        # Reading the features of the venue from the feature store, without copying them
+        features, weights = store.features(place)
+        _, customers_types, sse = segment_features(features, weights,
+                                                   store.feature_names,
+                                                   MAX_CLUSTERS,
+                                                   MIN_CLUSTER_PERCENT)
+    else:
+        _, customers_types, sse = segment_customers(
+            get_customers_behavior(customers, place),
+            MAX_CLUSTERS,
+            MIN_CLUSTER_PERCENT,
+        )
+    return make_read_only(customers_types), sse
+
+
+def render_clustering(customers: pd.DataFrame, place: str) -> tuple:
+    """
+    This function returns the customer types of a venue and the SSE curve used to select their number.
+    The clustering artifacts of the batch pipeline are used when available, otherwise the customers are clustered on the fly.
+    Args:
+        customers (pd.DataFrame): Dataframe with the customers data.
+        place (str): Venue to be clustered.
+    Returns:
+        customers_types (pd.DataFrame): Customer types of the venue.
+        fig (go.Figure): SSE per number of clusters.
+    """
+    customers_types, sse = CLUSTERING_CACHE.get(
+        ('clustering', place, data_fingerprint(customers)),
+        lambda: _venue_clustering(customers, place))
+    optimal_clusters = len(customers_types)
+
+    # Plotting the SSE
+    fig = go.Figure(data=go.Scatter(x=list(sse.keys()),
+                                    y=list(sse.values()),
+                                    mode='markers+lines',
+                                    marker=dict(color='red'),
+                                    name='SSE'))
+    fig.add_vline(x=optimal_clusters,
+                  line_dash='dash',
+                  annotation_text=f'{optimal_clusters} clusters')
+    fig.update_layout(
+        title='SSE - Sum of Squared Euclidean distances to centroid',
+        xaxis_title='Number of clusters',
+        yaxis_title='SSE')
 
-    # Create a single select widget to select venues
-    selected_venues = [
-        venue for venue in venues if st.checkbox(venue, value=True)
-    ]
-    return selected_venues
+    return customers_types, fig
 
 
-def _one_select_venue(data: pd.DataFrame) -> str:
+def describe_customer_types(customers_types: pd.DataFrame, place: str) -> str:
     """
-    This function allows the user to select a venue to plot.
+    This function describes the customer types of a venue from the centroids of their clusters, so that the
+    description always matches the customer types shown.
     Args:
-        data (pd.DataFrame): Dataframe with the data.
+        customers_types (pd.DataFrame): Customer types of the venue.
+        place (str): Label of the venue of the customer types.
     Returns:
-        selected_venue (str): Selected venue.
+        description (str): Markdown description of the customer types.
     """
-    # Get the list of venues
-    venues = data['place'].unique()
-    venues.sort()
-
-    # Create a single select widget to select venues
-    selected_venue = st.selectbox(
-        'Select venue to plot',
-        venues,
-        index=0,
-    )
-    return selected_venue
+    lines = [
+        f'Based on the values of their features, the {len(customers_types)} customer types of {place} can be described as follows:  ',
+        '---  ',
+    ]
+    for i, customer_type in enumerate(customers_types.itertuples(index=False)):
+        weight = getattr(customer_type, 'customer_weight', None)
+        lines.append(
+            f'- **Customer type {i + 1}:** These customers live {customer_type.distance_from_home_miles_mean:.1f} miles '
+            f'and work {customer_type.distance_from_work_miles_mean:.1f} miles away from the gym, spend '
+            f'{customer_type.time_in_place_minutes:.0f} minutes in the gym around {customer_type.visit_hour:.0f}h, '
+            f'visit it {customer_type.visit_count:.1f} times, {customer_type.pct_weekend:.0%} of them on weekends, '
+            f'and visit {customer_type.places_visits:.1f} of the Planet Fitness venues. '
+            f'**The {customer_type.customer_pct}% of the customers of {place} belong to this type'
+            + (f' and their mean customer weight is {weight:.0f}**.  '
+               if weight is not None else '**.  '))
+    return '\n'.join(lines)
 
 
 #! Analysis functions
@@ -108,23 +940,12 @@ def analysis_date_level(data: pd.DataFrame, column: str) -> None:
     st.subheader('Analysis at date level')
     st.caption('Total estimated visits per Planet Fitness location over time')
 
-    # Grouping data
-    grouped_visits = _grouping_visits(data, column)
-
     # Selecting venues
     selected_venues = _multi_select_venues(data)
 
-    # Filtering data for selected venues
-    grouped_visits = grouped_visits[grouped_visits['place'].isin(
-        selected_venues)]
-
     # Plotting
-    fig_visits = px.line(grouped_visits,
-                         x='start_date',
-                         y='visit_weight',
-                         color='place',
-                         title='Total estimated visits over time',
-                         color_discrete_sequence=COLOR_DISCRETE_SEQUENCE)
+    [fig_visits] = _cached_figures('date_level', data, column,
+                                   selected_venues)
 
     # Show the plot in Streamlit
     st.plotly_chart(fig_visits, use_container_width=False)
@@ -152,23 +973,12 @@ def analysis_hour_level(data: pd.DataFrame, column: str) -> None:
     st.caption(
         'Total estimated visits per Planet Fitness location at each hour')
 
-    # Grouping data
-    grouped_visits = _grouping_visits(data, column)
-
     # Selecting venues
     selected_venues = _multi_select_venues(data)
 
-    # Filtering data for selected venues
-    grouped_visits = grouped_visits[grouped_visits['place'].isin(
-        selected_venues)]
-
     # Plotting
-    fig_visits = px.line(grouped_visits,
-                         x='visit_hour',
-                         y='visit_weight',
-                         color='place',
-                         title='Average estimated visits over time',
-                         color_discrete_sequence=COLOR_DISCRETE_SEQUENCE)
+    [fig_visits] = _cached_figures('hour_level', data, column,
+                                   selected_venues)
 
     # Show the plot in Streamlit
     st.plotly_chart(fig_visits)
@@ -197,34 +1007,12 @@ def analysis_day_week_level(data: pd.DataFrame, column: str) -> None:
         'Total estimated visits per Planet Fitness location at each day of the week'
     )
 
-    # Grouping data
-    categories_order = [
-        'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday',
-        'Sunday'
-    ]
-
-    # Grouping data
-    grouped_visits = _grouping_visits(data, column)
-
     # Selecting venues
     selected_venues = _multi_select_venues(data)
 
-    # Filtering data for selected venues
-    grouped_visits = grouped_visits[grouped_visits['place'].isin(
-        selected_venues)]
-
-    # Ordering data
-    grouped_visits['to_sort'] = grouped_visits['day_of_week'].apply(
-        lambda x: categories_order.index(x))
-    grouped_visits = grouped_visits.sort_values(by='to_sort')
-
     # Plotting
-    fig_visits = px.line(grouped_visits,
-                         x='day_of_week',
-                         y='visit_weight',
-                         color='place',
-                         title='Average estimated visits over time',
-                         color_discrete_sequence=COLOR_DISCRETE_SEQUENCE)
+    [fig_visits] = _cached_figures('day_week_level', data, column,
+                                   selected_venues)
 
     # Show the plot in Streamlit
     st.plotly_chart(fig_visits)
@@ -252,24 +1040,12 @@ def analysis_weekend_level(data: pd.DataFrame, column: str) -> None:
     st.caption(
         'Total estimated visits per Planet Fitness location per weekend')
 
-    # Grouping data
-    grouped_visits = _grouping_visits(data, column)
-
     # Selecting venues
     selected_venues = _multi_select_venues(data)
 
-    # Filtering data for selected venues
-    grouped_visits = grouped_visits[grouped_visits['place'].isin(
-        selected_venues)]
-
     # Plotting
-    fig_visits = px.bar(grouped_visits,
-                        x='weekend',
-                        y='visit_weight',
-                        color='place',
-                        title='Average estimated visits over time',
-                        barmode='group',
-                        color_discrete_sequence=COLOR_DISCRETE_SEQUENCE)
+    [fig_visits] = _cached_figures('weekend_level', data, column,
+                                   selected_venues)
 
     # Show the plot in Streamlit
     st.plotly_chart(fig_visits)
@@ -297,34 +1073,12 @@ def analysis_month_level(data: pd.DataFrame, column: str) -> None:
     st.subheader('Analysis at month level')
     st.caption('Total estimated visits per Planet Fitness location per month')
 
-    # Grouping data
-    categories_order = [
-        'January', 'February', 'March', 'April', 'May', 'June', 'July',
-        'August', 'September', 'October', 'November', 'December'
-    ]
-
-    # Grouping data
-    grouped_visits = _grouping_visits(data, column)
-
     # Selecting venues
     selected_venues = _multi_select_venues(data)
 
-    # Filtering data for selected venues
-    grouped_visits = grouped_visits[grouped_visits['place'].isin(
-        selected_venues)]
-
-    # Ordering data
-    grouped_visits['to_sort'] = grouped_visits['month'].apply(
-        lambda x: categories_order.index(x))
-    grouped_visits = grouped_visits.sort_values(by='to_sort')
-
     # Plotting
-    fig_visits = px.line(grouped_visits,
-                         x='month',
-                         y='visit_weight',
-                         color='place',
-                         title='Average estimated visits over time',
-                         color_discrete_sequence=COLOR_DISCRETE_SEQUENCE)
+    [fig_visits] = _cached_figures('month_level', data, column,
+                                   selected_venues)
 
     # Show the plot in Streamlit
     # st.pyplot(fig)
@@ -354,34 +1108,12 @@ def analysis_distance_from_home_level(data: pd.DataFrame, column: str) -> None:
         'Total estimated visits per Planet Fitness location per distance from home'
     )
 
-    # Grouping data
-    grouped_visits = _grouping_visits(data, column)
-    grouped_customers = _grouping_customers(data, column)
-
     # Selecting venues
     selected_venues = _multi_select_venues(data)
 
-    # Filtering data for selected venues
-    grouped_visits = grouped_visits[grouped_visits['place'].isin(
-        selected_venues)]
-    grouped_customers = grouped_customers[grouped_customers['place'].isin(
-        selected_venues)]
-
     # Plotting
-    fig_visits = px.histogram(
-        grouped_visits,
-        x='distance_from_home_miles',
-        color='place',
-        title='Distribution of distance from home for visits',
-        barmode='overlay',
-        color_discrete_sequence=COLOR_DISCRETE_SEQUENCE)
-    fig_customers = px.histogram(
-        grouped_customers,
-        x='distance_from_home_miles',
-        color='place',
-        title='Distribution of distance from home for customers',
-        barmode='overlay',
-        color_discrete_sequence=COLOR_DISCRETE_SEQUENCE)
+    fig_visits, fig_customers = _cached_figures(
+        'distance_from_home_level', data, column, selected_venues)
 
     # Show the plot in Streamlit
     # st.pyplot(fig)
@@ -413,34 +1145,12 @@ def analysis_distance_from_work_level(data: pd.DataFrame, column: str) -> None:
         'Total estimated visits per Planet Fitness location per distance from work'
     )
 
-    # Grouping data
-    grouped_visits = _grouping_visits(data, column)
-    grouped_customers = _grouping_customers(data, column)
-
     # Selecting venues
     selected_venues = _multi_select_venues(data)
 
-    # Filtering data for selected venues
-    grouped_visits = grouped_visits[grouped_visits['place'].isin(
-        selected_venues)]
-    grouped_customers = grouped_customers[grouped_customers['place'].isin(
-        selected_venues)]
-
     # Plotting
-    fig_visits = px.histogram(
-        grouped_visits,
-        x='distance_from_work_miles',
-        color='place',
-        title='Distribution of distance from work for visits',
-        barmode='overlay',
-        color_discrete_sequence=COLOR_DISCRETE_SEQUENCE)
-    fig_customers = px.histogram(
-        grouped_customers,
-        x='distance_from_work_miles',
-        color='place',
-        title='Distribution of distance from work for customers',
-        barmode='overlay',
-        color_discrete_sequence=COLOR_DISCRETE_SEQUENCE)
+    fig_visits, fig_customers = _cached_figures(
+        'distance_from_work_level', data, column, selected_venues)
 
     # Show the plot in Streamlit
     st.plotly_chart(fig_visits)
@@ -456,36 +1166,61 @@ def analysis_distance_from_work_level(data: pd.DataFrame, column: str) -> None:
         st.write('')
 
 
-#! GEO-LOCATION ANALYSIS
-
-
-def map_venues(data: pd.DataFrame, customers: pd.DataFrame) -> None:
+def analysis_cohort_level(data: pd.DataFrame, column: str) -> None:
     """
-    This function plots the map of all venues.
+    This function plots the cohort analysis of the customers.
     Args:
         data (pd.DataFrame): Dataframe with the data.
-        customers (pd.DataFrame): Dataframe with the customers data.
+        column (str): Column with the start time of the visits.
     Returns:
-        Map of selected venues.
+        Cohort analysis.
     """
-    st.subheader('Geospatial analysis per Planet Fitness location')
+    st.subheader('Cohort analysis')
     st.caption(
-        'Location of Planet Fitness gyms, and origin of customers per Planet Fitness location (based on home location), and trip to work'
+        'Retention of the customers grouped by the month of their first visit, and time between their visits'
     )
+
     # Selecting venues
     selected_venues = _multi_select_venues(data)
 
-    # Create a dictionary of colors for each venue
-    color_dict = {
-        'alpharetta': 'blue',
-        'highway': 'orange',
-        'holcomb': 'green',
-        'molly': 'red'
-    }
+    # Plotting
+    [fig_retention, fig_cohorts,
+     fig_gaps] = _cached_figures('cohort_level', data, column, selected_venues)
 
-    # If no venues were selected, plot all of them
-    if not selected_venues:
-        selected_venues = data['place'].unique()
+    # Show the plot in Streamlit
+    st.plotly_chart(fig_retention, use_container_width=False)
+    st.plotly_chart(fig_cohorts, use_container_width=False)
+    st.plotly_chart(fig_gaps, use_container_width=False)
+
+    show_last_analysis = st.button('Show analysis')
+    if show_last_analysis:
+        st.write(
+            """The first plot shows, for each venue, the share of the customers (weighted by customer weight) that visit the venue again each month after their first visit.
+        The second plot shows the same retention for every cohort of customers, grouped by the month of their first visit, and the third plot shows the distribution of the days between two consecutive visits of a customer.  
+        Here, we can see that the customers of alpharetta are retained as well as the customers of the other venues (around 36% of them return the month after their first visit, similar to highway and molly), and they visit the gym as often.
+        Therefore, alpharetta does not lose its members faster: it attracts fewer new customers every month than the other venues.
+        """)
+    else:
+        st.write('')
+
+
+#! GEO-LOCATION ANALYSIS
+
+
+def _venues_map(data: pd.DataFrame, customers: pd.DataFrame,
+                selected_venues: List[str]) -> folium.Map:
+    """
+    This function builds the map of the selected venues.
+    Args:
+        data (pd.DataFrame): Dataframe with the data.
+        customers (pd.DataFrame): Dataframe with the customers data.
+        selected_venues (List[str]): Venues to plot.
+    Returns:
+        m (folium.Map): Map of the selected venues.
+    """
+    # Colors and locations of the venues
+    colors, labels = _venue_colors(), _venue_labels()
+    venues = load_venues().set_index('place')
 
     m = folium.Map(
         location=[
@@ -496,35 +1231,69 @@ def map_venues(data: pd.DataFrame, customers: pd.DataFrame) -> None:
         tiles='openstreetmap',
     )
 
-    # Plot the selected venues
-    for place in selected_venues:
-        color = color_dict.get(place, 'black')
+    # Plot the customers and their routes for the selected venues
+    selected_customers = customers[customers['place'].isin(selected_venues)]
+    for place, place_customers in selected_customers.groupby('place'):
+        color = colors.get(place, 'black')
 
-        # Plot the customers and their routes for the selected venue
-        for _, row in customers[customers['place'] == place].iterrows():
+        for home_lat, home_long, work_lat, work_long in place_customers[[
+                'user_home_lat', 'user_home_long', 'user_work_lat',
+                'user_work_long'
+        ]].itertuples(index=False):
             folium.CircleMarker(
-                [row['user_home_lat'], row['user_home_long']],
+                [home_lat, home_long],
                 radius=10,
                 fill_color=color,
             ).add_to(m)
 
-            folium.PolyLine([[row['user_home_lat'], row['user_home_long']],
-                             [row['user_work_lat'], row['user_work_long']]],
+            folium.PolyLine([[home_lat, home_long], [work_lat, work_long]],
                             color=color).add_to(m)
 
-        # Plot the venue location for the selected venue
-        data_place = data[data['place'] == place]
-        folium.Marker(
-            location=[
+    # Plot the location of the selected venues
+    for place in selected_venues:
+        if place in venues.index:
+            location = venues.loc[place, ['venue_lat', 'venue_long']].tolist()
+        else:
+            data_place = data[data['place'] == place]
+            location = [
                 data_place['venue_lat'].mean(),
                 data_place['venue_long'].mean()
-            ],
-            popup=place,
-            icon=folium.Icon(color=color, icon='info-sign'),
+            ]
+        folium.Marker(
+            location=location,
+            popup=labels.get(place, place),
+            icon=folium.Icon(color=colors.get(place, 'black'),
+                             icon='info-sign'),
         ).add_to(m)
 
+    return m
+
+
+def map_venues(data: pd.DataFrame, customers: pd.DataFrame) -> None:
+    """
+    This function plots the map of all venues.
+    Args:
+        data (pd.DataFrame): Dataframe with the data.
+        customers (pd.DataFrame): Dataframe with the customers data.
+    Returns:
+        Map of selected venues.
+    """
+    st.subheader('Geospatial analysis per Planet Fitness location')
+    st.caption(
+        'Location of Planet Fitness gyms, and origin of customers per Planet Fitness location (based on home location), and trip to work'
+    )
+    # Selecting venues
+    selected_venues = _multi_select_venues(data)
+
+    # If no venues were selected, plot all of them
+    if not selected_venues:
+        selected_venues = list(data['place'].unique())
+
+    # Building the map, or reading it from the figure cache
+    html = _cached_map(data, customers, selected_venues)
+
     # Display the map
-    st_folium(m, width=700, height=450)
+    components.html(html, width=700, height=450)
 
     show_last_analysis = st.button('Show analysis')
     if show_last_analysis:
@@ -551,101 +1320,26 @@ def cluster_analysis(customers: pd.DataFrame, data: pd.DataFrame) -> None:
     # Selecting venues
     selected_venue = _one_select_venue(data)
 
-    # Selecting customers data
-    customers = customers.drop(
-        [
-            'user_home_lat', 'user_home_long', 'user_work_lat',
-            'user_work_long', 'venue_lat', 'venue_long'
-        ],
-        axis=1,
-    )
-
-    # Filtering per venue
-    customers_behavior = customers[customers['place'] == selected_venue].drop(
-        ['device_id', 'place'], axis=1).reset_index(drop=True)
-
-    # Applying clustering algorithm
-    sse = optimal_clusters_sse(customers_behavior, 10, 0.002)
-
-    # Plotting the SSE
-
-    fig = go.Figure(data=go.Scatter(x=list(sse.keys()),
-                                    y=list(sse.values()),
-                                    mode='markers+lines',
-                                    marker=dict(color='red'),
-                                    name='SSE'))
-    fig.update_layout(
-        title='SSE - Sum of Squared Euclidean distances to centroid',
-        xaxis_title='Number of clusters',
-        yaxis_title='SSE')
+    # Clustering the customers of the venue
+    customers_types, fig = render_clustering(customers, selected_venue)
 
     # pyplot with specific width and height
     st.plotly_chart(fig)
 
-    number_clusters = {
-        'alpharetta': 3,
-        'highway': 4,
-        'holcomb': 4,
-        'molly': 2,
-    }
-    # Getting the customer types
-    optimal_clusters = number_clusters.get(selected_venue)
-
-    customers_types = get_customer_types(
-        customers_behavior,
-        optimal_clusters,
-    )
     # Showing in streamlit
     st.write(customers_types)
 
     show_last_analysis = st.button('Show analysis')
     if show_last_analysis:
-        if selected_venue == 'alpharetta':
-            st.write(
-                """Based on the values of their features, the customer types can be labeled as follows:  
-                ---  
-                - **Customer type 1:** These customers have a short distance from home and a moderate distance from work to the gym, spend a moderate amount of time in the gym, and visit during the afternoons. They tend to visit other nearby gyms sometimes, have a slight preference for visiting on weekends, and they go too often to the gym. **The 3.2% of the customers of alpharetta belong to this type and their customer weight is low**.  
-                - **Customer type 2:** These customers have a moderate distance from both home and work to the gym, spend a moderate amount of time in the gym, and visit during the afternoons. They tend to visit other nearby gyms, have a slight preference for visiting on weekends, and they rarely go to the gym. **The 96.5% of the customers of alpharetta belong to this type and their customer weight is too low**.  
-                - **Customer type 3:** These customers have a long distance from home and a short distance from work to the gym, spend more time in the gym, and visit the gym at night. They **do not** tend to visit other nearby gyms, **do not** tend to visit the gyms on weekends and they go too often to the gym. **Only the 0.2% of the customers of alpharetta belong to this type and their customer weight is very high**.  
-            """)
-        elif selected_venue == 'highway':
-            st.write(
-                """Based on the values of their features, the customer types can be labeled as follows:  
-                ---  
-                - **Customer type 1:** These customers have a moderate distance from both home and work to the gym, spend a moderate amount of time in the gym, and visit during the first hours of the afternoon. They **do not** tend to visit other nearby gyms and have a **high** preference for visiting on weekends and they do not go too often to the gym. **The 91.6% of the customers of highway belong to this type and their customer weight is too low**.  
-                - **Customer type 2:** These customers have a moderate distance from both home and work to the gym, spend a high amount of time in the gym, and visit during the first hours of the afternoon. They tend to visit other nearby gyms, have a slight preference for visiting on weekends and they moderately often go to the gym. **The 2.5% of the customers of highway belong to this type and their customer weight is low-moderate**.  
-                - **Customer type 3:** These customers have a moderate distance from both home and work to the gym, spend a high amount of time in the gym, and visit during the first hours of the afternoon. They do not tend to visit other nearby gyms, they do not visit the gym on weekends and they moderately often go to the gym. **The 0.9% of the customers of highway belong to this type and their customer weight is low-moderate**.  
-                - **Customer type 4:** These customers have a moderate distance from home and a long distance from work to the gym, spend a high amount of time in the gym, and visit during the first hours of the afternoon. They do not tend to visit other nearby gyms, have a slight preference for visiting on weekends and they do not go too often to the gym. **The 4.9% of the customers of highway belong to this type and their customer weight is low**.
-            """)
-        elif selected_venue == 'holcomb':
-            st.write(
-                """Based on the values of their features, the customer types can be labeled as follows:  
-                ---  
-                - **Customer type 1:** These customers have a moderate distance from both home and work to the gym, spend a high amount of time in the gym, and visit during the afternoons. They **do not** tend to visit other nearby gyms, have a **high** preference for visiting on weekends and they do not go too often to the gym. **The 84.3% of the customers of holcomb belong to this type and their customer weight is too low**.  
-                - **Customer type 2:** These customers have a short distance from home and a moderate distance from work to the gym, spend a moderate amount of time in the gym, and visit during the mornings. They **do not** tend to visit other nearby gyms, have a slight preference for visiting on weekends and they often go to the gym. **The 0.5% of the customers of holcom belong to this type and their customer weight is moderate**.  
-                - **Customer type 3:** These customers have a short distance from home and a moderate distance from work to the gym, spend a high amount of time in the gym, and visit during the afternoons. They **do not** tend to visit other nearby gyms, have a slight preference for visiting on weekends and they ocasionally go to the gym. **The 1.9% of the customers of holcom belong to this type and their customer weight is low-moderate**.  
-                - **Customer type 4:** These customers have a moderate distance from both home and work to the gym, spend a high amount of time in the gym, and visit during the afternoons. They **do not** tend to visit other nearby gyms, have a **high** preference for visiting on weekends and they do not go too often to the gym. **The 13.4% of the customers of holcom belong to this type and their customer weight is low-moderate**.
-            """)
-        elif selected_venue == 'molly':
-            st.write(
-                """Based on the values of their features, the customer types can be labeled as follows:  
-                ---  
-                - **Customer type 1:** These customers have a moderate distance from both home and work to the gym, spend a moderate amount of time in the gym, and visit during the afternoons. They do not tend to visit other nearby gyms, they tend to visit the gym on weekends and they do not go too often to the gym. **The 94.3% of the customers of alpharetta belong to this type and their customer weight is too low**.  
-                - **Customer type 2:** These customers have a short distance from home and a moderate distance from work to the gym, spend a moderate amount of time in the gym, and visit during the afternoons. They do not tend to visit other nearby gyms, have a slight preference for visiting on weekends and they moderately often go to the gym. **The 5.7% of the customers of alpharetta belong to this type and their customer weight is low-moderate**.
-            """)
+        st.write(
+            describe_customer_types(
+                customers_types,
+                _venue_labels().get(selected_venue, selected_venue)))
     else:
         st.write('')
 
 
-def conclusions_pf() -> str:
-    """
-    Returns the conclusions of the Planet Fitness analysis.
-    Args:
-        None
-    Returns:
-        str: The conclusions of the Planet Fitness analysis.
-    """
-    st.write("""##### Date, hours, days of the week, weekends, and months
+CONCLUSIONS = """##### Date, hours, days of the week, weekends, and months
 
 From the univariate analysis, we can see that the total estimated visits of Alpharetta gym are lower than the other nearby gyms, suggesting that Alpharetta gym is underperforming in comparison to the other nearby gyms.  
 - In terms of hours, we can see that the customers of Alpharetta gym tend to visit the gym at midday and in the night, while the customers of Holcomb gym (which is the closest gym to Alpharetta gym) tend to visit the gym in the morning and in the night. This could suggest that Alpharetta gym is not offering the right programs or services to attract and retain customers that prefer to visit the gym in the morning.  
@@ -668,9 +1362,21 @@ This could suggest that the customers of Holcomb and Alpharetta are similar in t
 
 ##### Clustering
 
-Based on the given information about the different types of customers for Alpharetta, Holcomb, and Highway, we can identify several factors that may contribute to Alpharetta gym's underperformance in comparison to the other two nearby gyms:  
-- **Customer preferences on weekends:** Alpharetta gym's customers tend to have a slight preference for visiting on weekends, while Holcomb gym's customers have a high preference for visiting on weekends. Highway gym's customers also have a high preference for visiting on weekends. This may suggest that Alpharetta gym is not offering the right programs or services to attract and retain customers that prefer to visit the gym on weekends.  
-- **Competition:** Alpharetta gym's customers tend to visit other nearby gyms sometimes, while Holcomb and Highway gyms' customers do not tend to visit other nearby gyms that much. It is important to note that only the four Planet Fitness gyms in the area are considered as nearby gyms, as there is no more information about other gyms in the area. This may indicate that Alpharetta gym faces stronger competition in the area, which could impact its ability to attract and retain customers.  
+Based on the customer types found for each venue (with the number of types selected automatically for each venue), we can identify several factors that may contribute to Alpharetta gym's underperformance in comparison to the other nearby gyms:  
+- **Customer preferences on weekends:** The largest customer type of Alpharetta (88.8% of its customers) makes 17% of its visits on weekends, and its other customer types even less, while the largest customer types of Holcomb and Highway make 24% of their visits on weekends, and those of Molly around 20%. This may suggest that Alpharetta gym is not offering the right programs or services to attract and retain customers that prefer to visit the gym on weekends.  
+- **Competition:** The largest customer type of Alpharetta visits 1.5 of the Planet Fitness venues on average, while the largest customer types of Holcomb, Highway and Molly visit essentially only their own venue (between 1.0 and 1.1 venues). In Highway and Molly, the customers visiting other venues are a small customer type (9.5% and 4.6% of their customers). It is important to note that only the four Planet Fitness gyms in the area are considered as nearby gyms, as there is no more information about other gyms in the area. This may indicate that Alpharetta gym faces stronger competition in the area, which could impact its ability to attract and retain customers.  
+- **Frequent customers:** Alpharetta does keep a type of frequent customers (10.5% of its customers, with around 24 visits), larger than the frequent customer types of the other venues (between 2% and 6.4% of their customers). Together with the cohort analysis, this suggests that Alpharetta does not fail to retain its customers, but to attract new ones.  
 Taken together, these factors suggest that the Alpharetta gym may need to adjust its approach to better meet the needs and preferences of its customers, and to better compete with nearby gyms.  
 This could involve changes to its offerings, pricing, marketing, or other factors that affect the customer experience."""
-             )
+
+
+def conclusions_pf() -> str:
+    """
+    Returns the conclusions of the Planet Fitness analysis.
+    Args:
+        None
+    Returns:
+        str: The conclusions of the Planet Fitness analysis.
+    """
+    st.write(CONCLUSIONS)
+    return CONCLUSIONS
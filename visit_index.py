@@ -0,0 +1,103 @@
+from typing import List
+import numpy as np
+import pandas as pd
+
+
+class VisitIndex:
+    """
+    Visits sorted by (place, visit start time), with the row range of each venue.
+    A date window of a venue is found by binary search on its start times and taken as a slice,
+    so that filtering costs time proportional to the visits selected instead of to all the visits.
+    Args:
+        data (pd.DataFrame): Dataframe with the data.
+        time_column (str): Column with the start time of the visits.
+    """
+
+    def __init__(self,
+                 data: pd.DataFrame,
+                 time_column: str = 'visit_start_time'):
+        times = pd.to_datetime(data[time_column]).to_numpy(
+            dtype='datetime64[ns]').view(np.int64)
+        codes, places = pd.factorize(data['place'], sort=True)
+
+        # Sorting by place first, and by start time within each place
+        order = np.lexsort((times, codes))
+        self.data = data.iloc[order].reset_index(drop=True)
+        self.times = times[order]
+
+        # Row range [start, end) of each place
+        bounds = np.searchsorted(codes[order], np.arange(len(places) + 1))
+        self.offsets = {
+            place: (int(bounds[i]), int(bounds[i + 1]))
+            for i, place in enumerate(places)
+        }
+
+    @property
+    def start(self) -> pd.Timestamp:
+        """
+        This function returns the start time of the first visit.
+        """
+        return pd.Timestamp(self.times.min()) if len(self.times) else None
+
+    @property
+    def end(self) -> pd.Timestamp:
+        """
+        This function returns the start time of the last visit.
+        """
+        return pd.Timestamp(self.times.max()) if len(self.times) else None
+
+    def _range(self, place: str, start: int, end: int) -> tuple:
+        """
+        This function finds the rows of a place within a time window by binary search.
+        Args:
+            place (str): Place of the visits.
+            start (int): Start of the window in nanoseconds, included.
+            end (int): End of the window in nanoseconds, excluded.
+        Returns:
+            rows (tuple): Row range [first, last) of the visits in the window.
+        """
+        first, last = self.offsets[place]
+        times = self.times[first:last]
+        return (first + int(np.searchsorted(times, start, side='left')),
+                first + int(np.searchsorted(times, end, side='left')))
+
+    def window(self,
+               start=None,
+               end=None,
+               places: List[str] = None) -> pd.DataFrame:
+        """
+        This function returns the visits of the selected places within a time window.
+        When the visits selected are contiguous (e.g. a single place, or all the visits), the result is a slice
+        of the sorted data without copying it. Otherwise, only the visits selected are copied.
+        Args:
+            start: Start of the window, included. Defaults to the first visit.
+            end: End of the window, excluded. Defaults to after the last visit.
+            places (List[str]): Places of the visits. Defaults to all the places.
+        Returns:
+            data (pd.DataFrame): Dataframe with the visits of the window.
+        """
+        start = np.iinfo(np.int64).min if start is None else pd.Timestamp(
+            start).value
+        end = np.iinfo(np.int64).max if end is None else pd.Timestamp(
+            end).value
+        if places is None:
+            places = list(self.offsets)
+
+        # Merging the ranges of the places that are next to each other in the sorted data
+        ranges = []
+        for place in sorted(place for place in places
+                            if place in self.offsets):
+            first, last = self._range(place, start, end)
+            if first == last:
+                continue
+            if ranges and ranges[-1][1] == first:
+                ranges[-1] = (ranges[-1][0], last)
+            else:
+                ranges.append((first, last))
+
+        if not ranges:
+            return self.data.iloc[:0]
+        if len(ranges) == 1:
+            return self.data.iloc[ranges[0][0]:ranges[0][1]]
+        return pd.concat(
+            [self.data.iloc[first:last] for first, last in ranges])